@@ -0,0 +1,145 @@
+"""Admission control for the model-backed routes.
+
+Requests that would call the model pass two checks before their handler
+runs:
+
+1. A per-user token bucket (rate_limit.TokenBucketLimiter), so one client
+   cannot use up the shared capacity.
+2. A global cap on concurrently admitted requests. A request that finds
+   every slot taken waits in a short queue, at most `queue_timeout`
+   seconds and `max_queue` requests deep, instead of piling up on the
+   worker threads.
+
+Interactive requests are admitted ahead of queued background requests
+(such as insights generation). Background requests may not take the last
+`interactive_reserve` slots. When the queue is full, an interactive
+arrival evicts the most recently queued background request.
+
+A request that is not admitted fails immediately with AdmissionRejected.
+Its retry_after is a hint for the Retry-After header. Everything is per
+process, like the rest of the in-memory limits.
+"""
+import heapq
+import itertools
+import math
+import threading
+import time
+
+from rate_limit import TokenBucketLimiter
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+_RANK = {INTERACTIVE: 0, BACKGROUND: 1}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed; `reason` is 'rate_limited', 'queue_full' or 'queue_timeout'"""
+
+    def __init__(self, message, reason, retry_after):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ('rank', 'seq', 'evicted')
+
+    def __init__(self, rank, seq):
+        self.rank = rank
+        self.seq = seq
+        self.evicted = False
+
+    def __lt__(self, other):
+        return (self.rank, self.seq) < (other.rank, other.seq)
+
+
+class AdmissionController:
+    """Per-user rate limits plus a global, priority-aware concurrency cap"""
+
+    def __init__(self, max_concurrent=16, max_queue=32, queue_timeout=0.5, user_rate=1.0, user_burst=20,
+                 interactive_reserve=None):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.interactive_reserve = interactive_reserve if interactive_reserve is not None else max(1, max_concurrent // 4)
+        self.user_limiter = TokenBucketLimiter(user_rate, user_burst) if user_rate else None
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+        self.active = 0
+        self.admitted = 0
+        self.rejected = {'rate_limited': 0, 'queue_full': 0, 'queue_timeout': 0}
+        # Moving average of how long admitted requests hold their slot, for Retry-After hints
+        self._hold_seconds = 1.0
+
+    def _limit(self, rank):
+        return self.max_concurrent if rank == 0 else max(1, self.max_concurrent - self.interactive_reserve)
+
+    def _retry_after(self):
+        """Seconds until a slot is likely to free up for a request at the back of the queue"""
+        return max(1, math.ceil(self._hold_seconds * (len(self._waiters) + 1) / self.max_concurrent))
+
+    def _reject(self, reason, message, retry_after):
+        self.rejected[reason] += 1
+        raise AdmissionRejected(message, reason, retry_after)
+
+    def acquire(self, user_key=None, priority=INTERACTIVE):
+        """Take a slot for user_key, waiting briefly if necessary; raises AdmissionRejected"""
+        rank = _RANK[priority]
+        if self.user_limiter is not None and user_key is not None:
+            wait = self.user_limiter.take(user_key)
+            if wait:
+                with self._cond:
+                    self._reject('rate_limited', "Too many AI requests. Please slow down.", max(1, math.ceil(wait)))
+
+        with self._cond:
+            if not self._waiters and self.active < self._limit(rank):
+                self.active += 1
+                self.admitted += 1
+                return
+            if len(self._waiters) >= self.max_queue:
+                victim = max(self._waiters) if rank == 0 else None
+                if victim is None or victim.rank == 0:
+                    self._reject('queue_full', "Server is busy. Please try again shortly.", self._retry_after())
+                # Make room by shedding the most recently queued background request
+                self._waiters.remove(victim)
+                heapq.heapify(self._waiters)
+                victim.evicted = True
+            waiter = _Waiter(rank, next(self._seq))
+            heapq.heappush(self._waiters, waiter)
+            self._cond.notify_all()
+            deadline = time.monotonic() + self.queue_timeout
+            while True:
+                if waiter.evicted:
+                    self._reject('queue_full', "Server is busy. Please try again shortly.", self._retry_after())
+                if self._waiters[0] is waiter and self.active < self._limit(rank):
+                    heapq.heappop(self._waiters)
+                    self.active += 1
+                    self.admitted += 1
+                    # The next waiter may be admissible too
+                    self._cond.notify_all()
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                    self._reject('queue_timeout', "Server is busy. Please try again shortly.", self._retry_after())
+                self._cond.wait(remaining)
+
+    def release(self, held_seconds=None):
+        with self._cond:
+            self.active -= 1
+            if held_seconds is not None:
+                self._hold_seconds += 0.1 * (held_seconds - self._hold_seconds)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'active': self.active,
+                'queued': len(self._waiters),
+                'admitted': self.admitted,
+                'rejected': dict(self.rejected),
+            }
@@ -0,0 +1,145 @@
+"""Per-user analytics rollups kept up to date as sessions are ingested.
+
+Each user has one document in the `session_rollups` collection, with the
+user id as its _id:
+
+    {'_id': user_id, 'total_sessions': n, 'total_duration': s,
+     'features': {name: count}, 'document_types': {type: count}}
+
+Every ingested session document is turned into a $inc update, so the
+stats endpoint is a single point read by _id. It no longer aggregates the
+user's whole session history. backfill_rollups() rebuilds the rollups
+from the sessions collection: use it for data written before rollups
+existed, or to repair counts after a failed increment.
+
+pymongo is imported inside the functions that build its operations, so
+deployments on the SQLite storage never load it.
+"""
+from collections import Counter
+
+ROLLUP_COLLECTION = 'session_rollups'
+
+# Sessions without a document type are counted under this key
+NONE_KEY = '~none'
+# Empty strings (e.g. the hostname of a file:// page) are not valid Mongo field names
+EMPTY_KEY = '~empty'
+
+
+def _encode_key(value):
+    """Make a value safe to use as a Mongo field name (not empty, no '.', no leading '$')"""
+    if value is None:
+        return NONE_KEY
+    if value == '':
+        return EMPTY_KEY
+    return str(value).replace('%', '%25').replace('.', '%2E').replace('$', '%24')
+
+
+def _decode_key(key):
+    if key == NONE_KEY:
+        return None
+    if key == EMPTY_KEY:
+        return ''
+    return key.replace('%24', '$').replace('%2E', '.').replace('%25', '%')
+
+
+def session_increments(session):
+    """The $inc document that adds one session to its user's rollup"""
+    inc = Counter({'total_sessions': 1, 'total_duration': session.get('duration') or 0})
+    for feature in session.get('features_used') or []:
+        inc[f"features.{_encode_key(feature)}"] += 1
+    inc[f"document_types.{_encode_key(session.get('document_type'))}"] += 1
+    return dict(inc)
+
+
+def apply_session_rollups(db, sessions):
+    """Fold newly inserted session documents into their users' rollups with one bulk write"""
+    from pymongo import UpdateOne
+
+    per_user = {}
+    for session in sessions:
+        per_user.setdefault(session['user_id'], Counter()).update(session_increments(session))
+    if not per_user:
+        return
+    db[ROLLUP_COLLECTION].bulk_write(
+        [UpdateOne({'_id': user_id}, {'$inc': dict(inc)}, upsert=True) for user_id, inc in per_user.items()],
+        ordered=False,
+    )
+
+
+def _ranked(counts):
+    """Counts as [{'_id': key, 'count': n}], most used first (the shape the old aggregations returned)"""
+    ranked = [{'_id': _decode_key(key), 'count': count} for key, count in (counts or {}).items() if count]
+    ranked.sort(key=lambda item: item['count'], reverse=True)
+    return ranked
+
+
+def read_user_stats(db, user_id):
+    """Stats for one user from their rollup document"""
+    rollup = db[ROLLUP_COLLECTION].find_one({'_id': user_id}) or {}
+    return {
+        'total_sessions': rollup.get('total_sessions', 0),
+        'feature_usage': _ranked(rollup.get('features')),
+        'document_types': _ranked(rollup.get('document_types')),
+    }
+
+
+def ensure_analytics_indexes(db):
+    """Create the indexes the analytics queries rely on (no-op when they already exist)"""
+    from pymongo import ASCENDING, DESCENDING
+
+    db.sessions.create_index([('user_id', ASCENDING), ('timestamp', DESCENDING)], name='user_id_timestamp')
+
+
+def backfill_rollups(db, batch_size=500):
+    """Rebuild every user's rollup from the sessions collection; returns the number of users written.
+
+    Sessions are streamed in user_id order (served by the user_id/timestamp
+    index), so only one user's counts are held in memory at a time. Run it
+    while ingest is quiet: increments applied to a user while their rollup is
+    being rebuilt are overwritten.
+    """
+    from pymongo import ASCENDING, ReplaceOne
+
+    collection = db[ROLLUP_COLLECTION]
+    cursor = db.sessions.find(
+        {}, {'user_id': 1, 'features_used': 1, 'document_type': 1, 'duration': 1, '_id': 0}
+    ).sort('user_id', ASCENDING)
+
+    writes = []
+    users = 0
+    current_user = None
+    counts = Counter()
+
+    def finish_user():
+        rollup = {'total_sessions': 0, 'total_duration': 0, 'features': {}, 'document_types': {}}
+        for field, value in counts.items():
+            if '.' in field:
+                group, key = field.split('.', 1)
+                rollup[group][key] = value
+            else:
+                rollup[field] = value
+        writes.append(ReplaceOne({'_id': current_user}, rollup, upsert=True))
+
+    for session in cursor:
+        user_id = session.get('user_id')
+        if user_id != current_user and counts:
+            finish_user()
+            users += 1
+            counts = Counter()
+            if len(writes) >= batch_size:
+                collection.bulk_write(writes, ordered=False)
+                writes = []
+        current_user = user_id
+        counts.update(session_increments(session))
+    if counts:
+        finish_user()
+        users += 1
+    if writes:
+        collection.bulk_write(writes, ordered=False)
+    return users
+
+
+def user_session_count(db, user_id):
+    """Number of sessions recorded in the user's rollup (0 if none)"""
+    rollup = db[ROLLUP_COLLECTION].find_one({'_id': user_id}, {'total_sessions': 1})
+    return (rollup or {}).get('total_sessions', 0)
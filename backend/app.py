@@ -1,79 +1,530 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
 import os
 from werkzeug.utils import secure_filename
-from werkzeug.security import generate_password_hash, check_password_hash
-import PyPDF2
+from werkzeug.exceptions import RequestEntityTooLarge
 from dotenv import load_dotenv
-import google.generativeai as genai
-from pymongo import MongoClient
-from datetime import datetime
+from datetime import datetime, timezone
 import json
+import time
 import base64
-from PIL import Image
-import io
-from docx import Document
+import zlib
+import threading
+import random
+import sys
+import importlib
+import functools
+import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from extraction_cache import ExtractionCache
+from response_cache import ResponseCache, MemoryTier, SQLiteTier, make_key
+from pdf_extraction import PdfExtractor
+from docx_extraction import iter_docx_blocks
+from chunked_summary import map_reduce_summarize
+from model_gate import ModelCallGate, ModelBusyError
+from model_registry import ModelRegistry, ModelTimeoutError
+from usage_logger import UsageLogger
+from image_pipeline import prepare_image, read_limited, PerceptualIndex, ImageTooLargeError
+from jobs import JobQueue, JobQueueFull, MemoryJobStore, SQLiteJobStore, FINISHED
+from uploads import HashingFileStream, UploadJanitor, UploadRejected
+from storage import MongoStorage, SQLiteStorage, BackgroundStorage, DuplicateUserError
+from passwords import PasswordHasher, HasherBusyError
+from rate_limit import TokenBucketLimiter
+from metrics import MetricsRegistry, InstrumentedProxy, SIZE_BUCKETS
+from insights_store import InsightsStore
+from hybrid_router import HybridRouter, CLOUD, ON_DEVICE
+from admission import AdmissionController, AdmissionRejected, INTERACTIVE, BACKGROUND
 
 load_dotenv()
 
+# Document uploads are streamed, size-capped and stored under their content hash
+MAX_UPLOAD_BYTES = int(float(os.getenv('MAX_UPLOAD_MB', '50')) * 1024 * 1024)
+UPLOAD_TTL = int(os.getenv('UPLOAD_TTL', str(24 * 3600)))
+UPLOAD_JANITOR_INTERVAL = int(os.getenv('UPLOAD_JANITOR_INTERVAL', '600'))
+
+class AppRequest(Request):
+    """Streams /upload file parts through HashingFileStream and rejects oversized uploads and event batches early"""
+
+    @property
+    def max_content_length(self):
+        if self.path == '/upload':
+            # Allow for multipart framing around the file itself
+            return MAX_UPLOAD_BYTES + 64 * 1024
+        if self.path == '/api/events/batch':
+            # A gzip body is never larger than the JSON it decompresses to (within a few bytes)
+            return EVENT_BATCH_MAX_BYTES + 1024
+        return super().max_content_length
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.path == '/upload' and filename:
+            extension = os.path.splitext(filename.lower())[1]
+            if extension not in ('.pdf', '.docx'):
+                raise UploadRejected("Only PDF and Word (.docx) files are allowed")
+            upload = HashingFileStream(app.config['UPLOAD_FOLDER'], extension, MAX_UPLOAD_BYTES)
+            # Every spooled part is tracked so teardown can delete the ones never stored
+            self.__dict__.setdefault('_spooled_uploads', []).append(upload)
+            return upload
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+    def discard_unstored_uploads(self):
+        """Delete the partial files of parts that were not stored (extra fields, rejected or failed requests)"""
+        for upload in self.__dict__.pop('_spooled_uploads', ()):
+            if not upload.stored:
+                upload.discard()
+
 app = Flask(__name__)
+app.request_class = AppRequest
 CORS(app)
 
-# simple request logger to debug 404s from the extension
+# Metrics for GET /metrics (Prometheus text format)
+metrics = MetricsRegistry('chromeai')
+http_requests = metrics.counter('http_requests_total', 'HTTP requests by route, method and status', ('method', 'route', 'status'))
+http_latency = metrics.histogram('http_request_duration_seconds', 'Time until the response is returned (headers only for streamed responses)', ('method', 'route'))
+http_request_size = metrics.histogram('http_request_size_bytes', 'Request body size', ('route',), SIZE_BUCKETS)
+http_response_size = metrics.histogram('http_response_size_bytes', 'Response body size (non-streamed responses)', ('route',), SIZE_BUCKETS)
+model_call_latency = metrics.histogram('model_call_duration_seconds', 'Gemini call duration', ('model', 'mode', 'outcome'))
+extraction_latency = metrics.histogram('document_extraction_duration_seconds', 'Document text extraction time on extraction-cache misses', ('format', 'mode'))
+storage_latency = metrics.histogram('storage_operation_duration_seconds', 'Storage (MongoDB/SQLite) call duration', ('backend', 'op'))
+hybrid_routes = metrics.counter('hybrid_route_decisions_total', 'Hybrid endpoint routing decisions', ('mode', 'target', 'reason'))
+admission_decisions = metrics.counter('admission_decisions_total', 'Admission control outcomes for model-backed routes', ('priority', 'outcome'))
+
+# Structured access log: JSON lines written to stderr by a background thread. Errors and slow requests are
+# always logged, everything else at ACCESS_LOG_SAMPLE_RATE.
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv('ACCESS_LOG_SAMPLE_RATE', '0.1'))
+ACCESS_LOG_SLOW_MS = float(os.getenv('ACCESS_LOG_SLOW_MS', '1000'))
+
+def _write_access_log(entries):
+    sys.stderr.write("".join(json.dumps(entry) + "\n" for entry in entries))
+    sys.stderr.flush()
+
+access_log = UsageLogger(_write_access_log, batch_size=200, flush_interval=1.0, max_queue=10000, label='access log')
+
 @app.before_request
-def _log_request():
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+    if not _services_started:
+        # Served as app:app rather than through create_app()
+        create_app()
+
+@app.after_request
+def _record_request(response):
     try:
-        print(">>> Incoming request:", request.method, request.path, "from", request.remote_addr)
-    except Exception:
-        pass
+        elapsed = time.perf_counter() - g.request_start
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        http_requests.inc(method=request.method, route=route, status=response.status_code)
+        http_latency.observe(elapsed, method=request.method, route=route)
+        if request.content_length:
+            http_request_size.observe(request.content_length, route=route)
+        if not response.is_streamed and response.content_length is not None:
+            http_response_size.observe(response.content_length, route=route)
+        
+        elapsed_ms = elapsed * 1000
+        if response.status_code >= 400 or elapsed_ms >= ACCESS_LOG_SLOW_MS or random.random() < ACCESS_LOG_SAMPLE_RATE:
+            access_log.enqueue({
+                'ts': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+                'method': request.method,
+                'path': request.path,
+                'route': route,
+                'status': response.status_code,
+                'ms': round(elapsed_ms, 1),
+                'ip': request.remote_addr,
+            })
+    except Exception as e:
+        print(f"Failed to record request metrics: {e}")
+    return response
+
+@app.teardown_request
+def _discard_unstored_uploads(exc):
+    request.discard_unstored_uploads()
 
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), "uploads")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+upload_janitor = UploadJanitor(UPLOAD_FOLDER, UPLOAD_TTL, UPLOAD_JANITOR_INTERVAL)
 
-# Configure Gemini API
-GEMINI_API_KEY = os.getenv('GOOGLE_AI_API_KEY')
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    GEMINI_ENABLED = True
+# Content-addressed cache of extracted document text (shared across users and requests)
+EXTRACTION_CACHE_DIR = os.getenv('EXTRACTION_CACHE_DIR', os.path.join(os.path.dirname(__file__), "cache", "extracted"))
+EXTRACTION_CACHE_MAX_MB = int(os.getenv('EXTRACTION_CACHE_MAX_MB', '256'))
+extraction_cache = ExtractionCache(EXTRACTION_CACHE_DIR, EXTRACTION_CACHE_MAX_MB * 1024 * 1024)
+
+# Gemini response cache: in-process LRU, plus an optional SQLite tier shared by all workers
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', '3600'))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1024'))
+RESPONSE_CACHE_SQLITE_PATH = os.getenv('RESPONSE_CACHE_SQLITE_PATH')
+RESPONSE_CACHE_SQLITE_MAX_ROWS = int(os.getenv('RESPONSE_CACHE_SQLITE_MAX_ROWS', '50000'))
+_response_cache_tiers = [MemoryTier(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL)]
+if RESPONSE_CACHE_SQLITE_PATH:
+    try:
+        _response_cache_tiers.append(SQLiteTier(RESPONSE_CACHE_SQLITE_PATH, RESPONSE_CACHE_TTL, RESPONSE_CACHE_SQLITE_MAX_ROWS))
+    except Exception as e:
+        print(f"Response cache SQLite tier disabled: {e}")
+response_cache = ResponseCache(_response_cache_tiers)
+
+# Image analyses are cached on an exact hash of the downscaled pixels. Setting this above 0 lets one
+# user's near-duplicate screenshots (perceptual hashes within this many bits) share cached analyses.
+IMAGE_HASH_MAX_DISTANCE = int(os.getenv('IMAGE_HASH_MAX_DISTANCE', '0'))
+image_hash_index = PerceptualIndex(IMAGE_HASH_MAX_DISTANCE) if IMAGE_HASH_MAX_DISTANCE > 0 else None
+
+# Background document jobs: JOB_STORE=sqlite shares job status between worker processes
+JOB_STORE = os.getenv('JOB_STORE', 'memory')
+JOB_SQLITE_PATH = os.getenv('JOB_SQLITE_PATH', os.path.join(os.path.dirname(__file__), "cache", "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_TTL = int(os.getenv('JOB_TTL', '3600'))
+# Async submissions beyond this many queued or running jobs (per process) are answered 429
+JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', str(JOB_WORKERS * 16)))
+if JOB_STORE == 'sqlite':
+    os.makedirs(os.path.dirname(JOB_SQLITE_PATH), exist_ok=True)
+    job_store = SQLiteJobStore(JOB_SQLITE_PATH)
 else:
-    GEMINI_ENABLED = False
+    job_store = MemoryJobStore()
+job_queue = JobQueue(job_store, JOB_WORKERS, JOB_TTL, JOB_MAX_PENDING)
+# Summarize and proofread steps of a job run side by side on this pool
+job_task_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS * 2, thread_name_prefix='job-task')
+
+# Largest image body accepted by the multimodal endpoints (raw, multipart or base64 JSON)
+MAX_IMAGE_UPLOAD_BYTES = int(float(os.getenv('MAX_IMAGE_UPLOAD_MB', '20')) * 1024 * 1024)
+
+# Large PDFs are extracted page-by-page on a process pool (PDF_EXTRACT_WORKERS=0 keeps it serial)
+PDF_EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', str(min(4, os.cpu_count() or 1))))
+PDF_PAGE_TIMEOUT = float(os.getenv('PDF_PAGE_TIMEOUT', '10'))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '16'))
+pdf_extractor = PdfExtractor(PDF_EXTRACT_WORKERS, PDF_PAGE_TIMEOUT, PDF_PARALLEL_MIN_PAGES)
+
+# Extraction warm-ups after /upload run on a small pool; beyond UPLOAD_WARMUP_MAX_PENDING queued
+# documents they are skipped (the first summarize/proofread then extracts on demand)
+UPLOAD_WARMUP_WORKERS = int(os.getenv('UPLOAD_WARMUP_WORKERS', '1'))
+UPLOAD_WARMUP_MAX_PENDING = int(os.getenv('UPLOAD_WARMUP_MAX_PENDING', '8'))
+upload_warmup_executor = ThreadPoolExecutor(max_workers=UPLOAD_WARMUP_WORKERS, thread_name_prefix='upload-warmup')
+_warmup_pending = set()
+_warmup_lock = threading.Lock()
+
+# Characters of document text the summarize/proofread prompts actually use; extraction stops there
+DOCUMENT_TEXT_BUDGET = int(os.getenv('DOCUMENT_TEXT_BUDGET', '30000'))
+
+# Long documents are summarized map-reduce style: chunks of SUMMARY_CHUNK_CHARS summarized
+# concurrently on a shared pool, then combined. SUMMARY_MAX_CHARS caps how much is read.
+SUMMARY_CHUNK_CHARS = int(os.getenv('SUMMARY_CHUNK_CHARS', '30000'))
+SUMMARY_MAX_CHARS = int(os.getenv('SUMMARY_MAX_CHARS', '500000'))
+SUMMARY_WORKERS = int(os.getenv('SUMMARY_WORKERS', '4'))
+summary_executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix='summary')
+
+# Global cap on in-flight Gemini calls; identical concurrent calls are coalesced into one
+MODEL_MAX_INFLIGHT = int(os.getenv('MODEL_MAX_INFLIGHT', '16'))
+MODEL_QUEUE_TIMEOUT = float(os.getenv('MODEL_QUEUE_TIMEOUT', '30'))
+model_gate = ModelCallGate(MODEL_MAX_INFLIGHT, MODEL_QUEUE_TIMEOUT)
+
+# Admission control in front of the model-backed routes: per-user requests per minute (0 = unlimited),
+# a cap on concurrently admitted requests and a short wait queue. Requests that do not get in are
+# answered 429 with Retry-After. Background routes (insights) cannot use the last
+# ADMISSION_INTERACTIVE_RESERVE slots and queue behind interactive ones.
+ADMISSION_USER_REQUESTS_PER_MINUTE = float(os.getenv('ADMISSION_USER_REQUESTS_PER_MINUTE', '60'))
+admission = AdmissionController(
+    max_concurrent=int(os.getenv('ADMISSION_MAX_CONCURRENT', str(MODEL_MAX_INFLIGHT))),
+    max_queue=int(os.getenv('ADMISSION_MAX_QUEUE', '32')),
+    queue_timeout=float(os.getenv('ADMISSION_QUEUE_TIMEOUT_MS', '500')) / 1000,
+    user_rate=ADMISSION_USER_REQUESTS_PER_MINUTE / 60,
+    user_burst=int(os.getenv('ADMISSION_USER_BURST', '20')),
+    interactive_reserve=int(os.environ['ADMISSION_INTERACTIVE_RESERVE']) if os.getenv('ADMISSION_INTERACTIVE_RESERVE') else None,
+)
+
+# Configure Gemini API: models are created once by the registry and shared by all requests.
+# GEMINI_BACKEND=stub serves canned responses for offline development and load testing.
+GEMINI_API_KEY = os.getenv('GOOGLE_AI_API_KEY')
+GEMINI_BACKEND = os.getenv('GEMINI_BACKEND', 'gemini')
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash-lite')
+# Deadline for a whole model call, retries included; GEMINI_ATTEMPT_TIMEOUT caps a single attempt
+GEMINI_TIMEOUT = float(os.getenv('GEMINI_TIMEOUT', '60'))
+GEMINI_ATTEMPT_TIMEOUT = float(os.getenv('GEMINI_ATTEMPT_TIMEOUT', '0')) or None
+GEMINI_MAX_ATTEMPTS = int(os.getenv('GEMINI_MAX_ATTEMPTS', '3'))
+# Consecutive transient failures that open the circuit (0 disables it), and seconds before a probe
+GEMINI_BREAKER_FAILURES = int(os.getenv('GEMINI_BREAKER_FAILURES', '5'))
+GEMINI_BREAKER_RESET = float(os.getenv('GEMINI_BREAKER_RESET', '30'))
+# Send a duplicate of a call still running after the recent p95 latency (costs extra quota)
+GEMINI_HEDGE = os.getenv('GEMINI_HEDGE', '0') == '1'
+GEMINI_GENERATION_CONFIG = {}
+if os.getenv('GEMINI_TEMPERATURE'):
+    GEMINI_GENERATION_CONFIG['temperature'] = float(os.getenv('GEMINI_TEMPERATURE'))
+if os.getenv('GEMINI_MAX_OUTPUT_TOKENS'):
+    GEMINI_GENERATION_CONFIG['max_output_tokens'] = int(os.getenv('GEMINI_MAX_OUTPUT_TOKENS'))
+model_registry = ModelRegistry(
+    backend=GEMINI_BACKEND,
+    default_model=GEMINI_MODEL,
+    api_key=GEMINI_API_KEY,
+    generation_config=GEMINI_GENERATION_CONFIG,
+    request_timeout=GEMINI_TIMEOUT,
+    stub_latency=float(os.getenv('STUB_MODEL_LATENCY_MS', '0')) / 1000,
+    max_workers=MODEL_MAX_INFLIGHT,
+    observer=lambda model_name, mode, seconds, outcome: model_call_latency.observe(seconds, model=model_name, mode=mode, outcome=outcome),
+    max_attempts=GEMINI_MAX_ATTEMPTS,
+    attempt_timeout=GEMINI_ATTEMPT_TIMEOUT,
+    breaker_failures=GEMINI_BREAKER_FAILURES,
+    breaker_reset=GEMINI_BREAKER_RESET,
+    hedge=GEMINI_HEDGE,
+    # Fault injection for the stub backend, to exercise retries and the breaker locally
+    stub_faults={
+        'error_rate': float(os.getenv('STUB_MODEL_ERROR_RATE', '0')),
+        'slow_rate': float(os.getenv('STUB_MODEL_SLOW_RATE', '0')),
+        'slow_latency': float(os.getenv('STUB_MODEL_SLOW_MS', '0')) / 1000,
+        'seed': int(os.environ['STUB_MODEL_SEED']) if os.getenv('STUB_MODEL_SEED') else None,
+    },
+)
+GEMINI_ENABLED = model_registry.enabled
+if not GEMINI_ENABLED:
     print("Warning: Gemini API key not found")
 
-# Initialize MongoDB Atlas
+# Storage for users, sessions and usage logs: STORAGE_BACKEND=mongo (MongoDB Atlas, the default when
+# MONGODB_URI is set) or sqlite (embedded file, for local runs, benchmarks and single-node deployments)
 MONGODB_URI = os.getenv('MONGODB_URI')
-MONGODB_ENABLED = False
-db = None
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'mongo' if MONGODB_URI else '').lower()
+STORAGE_SQLITE_PATH = os.getenv('STORAGE_SQLITE_PATH', os.path.join(os.path.dirname(__file__), "data", "chromeai_plus.sqlite3"))
+MONGO_LOG_WRITE_CONCERN = os.getenv('MONGO_LOG_WRITE_CONCERN', '1')
+# Seconds a usage-log batch or CLI command waits for storage that is still connecting
+STORAGE_WAIT_TIMEOUT = float(os.getenv('STORAGE_WAIT_TIMEOUT', '30'))
 
-if MONGODB_URI:
-    try:
-        client = MongoClient(MONGODB_URI)
-        # Test connection
-        client.admin.command('ping')
-        db = client['chromeai_plus']  # Database name
-        MONGODB_ENABLED = True
-        print("MongoDB Atlas connected successfully")
-    except Exception as e:
-        print(f"MongoDB connection failed: {e}")
-        MONGODB_ENABLED = False
-        db = None
+def _open_storage():
+    if STORAGE_BACKEND == 'mongo':
+        return MongoStorage(
+            MONGODB_URI,
+            max_pool_size=int(os.getenv('MONGO_MAX_POOL_SIZE', '50')),
+            min_pool_size=int(os.getenv('MONGO_MIN_POOL_SIZE', '0')),
+            connect_timeout_ms=int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '5000')),
+            server_selection_timeout_ms=int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+            socket_timeout_ms=int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '10000')),
+            log_write_concern=int(MONGO_LOG_WRITE_CONCERN) if MONGO_LOG_WRITE_CONCERN.isdigit() else MONGO_LOG_WRITE_CONCERN,
+        )
+    os.makedirs(os.path.dirname(STORAGE_SQLITE_PATH), exist_ok=True)
+    return SQLiteStorage(STORAGE_SQLITE_PATH)
+
+# The connection is made in the background once create_app() runs; until then storage.ready is False
+# and /health/ready answers 503. A database that cannot be reached is retried with backoff.
+if (STORAGE_BACKEND == 'mongo' and MONGODB_URI) or STORAGE_BACKEND == 'sqlite':
+    storage = BackgroundStorage(
+        STORAGE_BACKEND,
+        _open_storage,
+        wrap=lambda backend: InstrumentedProxy(backend, storage_latency, backend=backend.name),
+    )
 else:
+    storage = None
     print("Warning: MongoDB URI not found. Profile sync and analytics will be disabled.")
 
+STORAGE_ENABLED = storage is not None
+
+def storage_not_ready():
+    """503 response for requests that need storage while its connection is still being established"""
+    response = jsonify({"success": False, "error": "Storage is still connecting. Please try again shortly."})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+def model_unavailable(e):
+    """504 for a model call past its deadline; 503 (with Retry-After when known) for a busy model or open circuit"""
+    response = jsonify({"success": False, "error": str(e)})
+    if isinstance(e, ModelTimeoutError):
+        return response, 504
+    retry_after = getattr(e, 'retry_after', None)
+    if retry_after is not None:
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response, 503
+
+@app.cli.command('backfill-rollups')
+def backfill_rollups_command():
+    """Rebuild per-user analytics rollups from the stored sessions"""
+    if not STORAGE_ENABLED:
+        print("Storage not configured")
+        return
+    if not storage.start().wait(STORAGE_WAIT_TIMEOUT):
+        print(f"Storage not reachable: {storage.error}")
+        return
+    print(f"Rebuilt rollups for {storage.rebuild_rollups()} users")
+
+# Usage logs are queued in memory and written in batches off the request path
+def _write_usage_logs(docs):
+    if not storage.wait(STORAGE_WAIT_TIMEOUT):
+        raise RuntimeError(f"storage not ready after {STORAGE_WAIT_TIMEOUT:g}s")
+    storage.insert_usage_logs(docs)
+
+# Limits for /api/events/batch (applied after gzip decompression)
+EVENT_BATCH_MAX_EVENTS = int(os.getenv('EVENT_BATCH_MAX_EVENTS', '500'))
+EVENT_BATCH_MAX_BYTES = int(os.getenv('EVENT_BATCH_MAX_BYTES', str(2 * 1024 * 1024)))
+
+usage_logger = UsageLogger(
+    _write_usage_logs,
+    batch_size=int(os.getenv('USAGE_LOG_BATCH_SIZE', '100')),
+    flush_interval=float(os.getenv('USAGE_LOG_FLUSH_INTERVAL', '2')),
+    max_queue=int(os.getenv('USAGE_LOG_MAX_QUEUE', '10000')),
+    block_timeout=float(os.getenv('USAGE_LOG_BLOCK_TIMEOUT', '0')),
+)
+
+# Generated insights are stored per user and reused until enough new sessions arrive or they expire.
+# With INSIGHTS_REFRESH_WORKERS > 0 stale insights are served while a refresh runs in the background.
+insights_store = InsightsStore(
+    min_new_sessions=int(os.getenv('INSIGHTS_MIN_NEW_SESSIONS', '5')),
+    ttl=int(os.getenv('INSIGHTS_TTL', str(24 * 3600))),
+    background_workers=int(os.getenv('INSIGHTS_REFRESH_WORKERS', '0')),
+)
+
+# Password hashing runs on a bounded pool; PASSWORD_HASH_METHOD sets the algorithm and work factor
+# (werkzeug format, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000")
+password_hasher = PasswordHasher(
+    method=os.getenv('PASSWORD_HASH_METHOD', 'scrypt'),
+    workers=int(os.getenv('PASSWORD_HASH_WORKERS', '2')),
+    queue_timeout=float(os.getenv('PASSWORD_HASH_QUEUE_TIMEOUT', '5')),
+    executor=os.getenv('PASSWORD_HASH_EXECUTOR', 'thread'),
+)
+
+# Auth attempts allowed per minute, per email address and per client IP
+AUTH_ATTEMPTS_PER_EMAIL = int(os.getenv('AUTH_ATTEMPTS_PER_EMAIL', '10'))
+AUTH_ATTEMPTS_PER_IP = int(os.getenv('AUTH_ATTEMPTS_PER_IP', '30'))
+auth_email_limiter = TokenBucketLimiter(AUTH_ATTEMPTS_PER_EMAIL / 60, AUTH_ATTEMPTS_PER_EMAIL)
+auth_ip_limiter = TokenBucketLimiter(AUTH_ATTEMPTS_PER_IP / 60, AUTH_ATTEMPTS_PER_IP)
+
+# Hybrid routing: token limits of the on-device model and of text sent to the cloud (0 = no cut),
+# and the latency on-device runs may take before the cloud is preferred. Cloud latency is measured
+# here; on-device latency and failures are reported by the extension to /api/hybrid/telemetry.
+HYBRID_MODES = ('prompt', 'simplify')
+hybrid_router = HybridRouter(
+    on_device_max_tokens={
+        'prompt': int(os.getenv('HYBRID_ONDEVICE_PROMPT_MAX_TOKENS', '750')),
+        'simplify': int(os.getenv('HYBRID_ONDEVICE_SIMPLIFY_MAX_TOKENS', '1250')),
+    },
+    cloud_max_tokens={
+        'prompt': int(os.getenv('HYBRID_CLOUD_PROMPT_MAX_TOKENS', '2500')),
+        'simplify': int(os.getenv('HYBRID_CLOUD_SIMPLIFY_MAX_TOKENS', '0')),
+    },
+    latency_budget=float(os.getenv('HYBRID_LATENCY_BUDGET_MS', '3000')) / 1000,
+    min_on_device_success=float(os.getenv('HYBRID_MIN_ONDEVICE_SUCCESS', '0.8')),
+    window=int(os.getenv('HYBRID_ROUTER_WINDOW', '200')),
+)
+# Telemetry reports feed routing state shared by every user: each client IP may send this many
+# reports per minute, and reported latencies are capped so one outlier cannot skew the fit
+HYBRID_TELEMETRY_REPORTS_PER_MINUTE = int(os.getenv('HYBRID_TELEMETRY_REPORTS_PER_MINUTE', '120'))
+HYBRID_TELEMETRY_MAX_LATENCY_MS = float(os.getenv('HYBRID_TELEMETRY_MAX_LATENCY_MS', '60000'))
+telemetry_limiter = TokenBucketLimiter(HYBRID_TELEMETRY_REPORTS_PER_MINUTE / 60, HYBRID_TELEMETRY_REPORTS_PER_MINUTE)
+
+def readiness():
+    """(ready, checks): ready once every configured dependency can serve requests"""
+    checks = {"storage": storage.status() if STORAGE_ENABLED else {"state": "disabled"}}
+    return all(check['state'] in ('ready', 'disabled') for check in checks.values()), checks
+
 @app.route('/health', methods=['GET'])
 def health_check():
+    """Liveness: 200 whenever the process is serving; readiness is reported in the body"""
+    ready, checks = readiness()
     return jsonify({
         "status": "healthy",
         "message": "ChromeAI Plus backend running",
+        "ready": ready,
+        "checks": checks,
         "gemini_enabled": GEMINI_ENABLED,
-        "mongodb_enabled": MONGODB_ENABLED
+        "gemini_backend": GEMINI_BACKEND,
+        "mongodb_enabled": STORAGE_ENABLED and storage.name == 'mongo',
+        "storage_backend": storage.name if STORAGE_ENABLED else None
+    }), 200
+
+@app.route('/health/ready', methods=['GET'])
+def readiness_check():
+    """Readiness: 503 until storage is connected, so load balancers hold traffic back until then"""
+    ready, checks = readiness()
+    return jsonify({"ready": ready, "checks": checks}), 200 if ready else 503
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        "success": True,
+        "response_cache": response_cache.stats(),
+        "model_calls": model_gate.stats(),
+        "admission": admission.stats(),
+        "hybrid_routing": hybrid_router.stats(),
+        "model_resilience": model_registry.stats()
     }), 200
+
+metrics.gauge('model_calls_inflight', 'Gemini calls currently holding a slot', lambda: model_gate.stats()['inflight'])
+metrics.callback_counter('model_call_retries_total', 'Gemini call retries', lambda: model_registry.stats()['retries'])
+metrics.callback_counter('model_call_hedges_total', 'Hedged duplicate Gemini calls', lambda: model_registry.stats()['hedges'])
+metrics.callback_counter('model_calls_short_circuited_total', 'Gemini calls failed fast by the open circuit breaker', lambda: model_registry.stats()['short_circuited'])
+metrics.gauge('model_circuit_open', '1 while the Gemini circuit breaker is not closed', lambda: int(model_registry.stats().get('breaker', 'closed') != 'closed'))
+metrics.gauge('admission_active', 'Requests currently admitted to model-backed routes', lambda: admission.stats()['active'])
+metrics.gauge('admission_queued', 'Requests waiting for admission', lambda: admission.stats()['queued'])
+metrics.gauge('password_hashes_inflight', 'Password hashes currently running', lambda: password_hasher.stats()['inflight'])
+metrics.callback_counter('response_cache_hits_total', 'Response cache hits', lambda: response_cache.stats()['hits'])
+metrics.callback_counter('response_cache_misses_total', 'Response cache misses', lambda: response_cache.stats()['misses'])
+metrics.gauge('document_jobs_pending', 'Async document jobs queued or running in this process', lambda: job_queue.stats()['pending'])
+metrics.gauge('usage_log_queue_depth', 'Usage logs waiting to be written', lambda: usage_logger.stats()['queued'])
+metrics.callback_counter('usage_logs_dropped_total', 'Usage logs dropped because the queue was full', lambda: usage_logger.stats()['dropped'])
+metrics.callback_counter('access_logs_dropped_total', 'Access log lines dropped because the queue was full', lambda: access_log.stats()['dropped'])
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def admission_key():
+    """Rate-limit key for the request: the userId it names (body, query or URL), else the client IP"""
+    # Large JSON bodies (base64 images) are not parsed just to find the user
+    small_json = request.is_json and (request.content_length or 0) <= 1024 * 1024
+    data = request.get_json(silent=True) if small_json else None
+    user_id = data.get('userId') if isinstance(data, dict) else None
+    user_id = user_id or (request.view_args or {}).get('user_id') or request.args.get('userId')
+    if user_id and user_id != 'anonymous':
+        return f"user:{user_id}"
+    return f"ip:{request.remote_addr}"
+
+def run_admitted(respond, priority=INTERACTIVE):
+    """Return respond()'s response once admission control lets the request in, else a 429.
+
+    The slot is held until the response is returned, or until a streamed response closes.
+    Routes that only sometimes call the model wrap just that branch in this.
+    """
+    try:
+        admission.acquire(admission_key(), priority)
+    except AdmissionRejected as e:
+        admission_decisions.inc(priority=priority, outcome=e.reason)
+        response = jsonify({"success": False, "error": str(e)})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+    admission_decisions.inc(priority=priority, outcome='admitted')
+    start = time.perf_counter()
+    released = threading.Event()
+    
+    def release():
+        if not released.is_set():
+            released.set()
+            admission.release(time.perf_counter() - start)
+    
+    try:
+        response = app.make_response(respond())
+    except BaseException:
+        release()
+        raise
+    if response.is_streamed:
+        response.call_on_close(release)
+    else:
+        release()
+    return response
+
+def admitted(priority=INTERACTIVE):
+    """Route decorator: run the whole handler under run_admitted"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            return run_admitted(lambda: view(*args, **kwargs), priority)
+        return wrapper
+    return decorator
+
+def auth_rate_limited(email):
+    """Return a 429 response if this client IP or email has used up its auth attempts, else None"""
+    wait = auth_ip_limiter.take(request.remote_addr) or auth_email_limiter.take(email)
+    if not wait:
+        return None
+    response = jsonify({"success": False, "error": "Too many attempts. Please try again later."})
+    response.headers['Retry-After'] = str(int(wait) + 1)
+    return response, 429
     
 @app.route('/api/auth/register', methods=['POST'])
 def register_user():
     try:
-        if not MONGODB_ENABLED:
-            return jsonify({"success": False, "error": "MongoDB not configured"}), 400
+        if not STORAGE_ENABLED:
+            return jsonify({"success": False, "error": "Storage not configured"}), 400
+        if not storage.ready:
+            return storage_not_ready()
             
         data = request.json
         email = data.get('email').lower()
@@ -82,14 +533,15 @@ def register_user():
         if not email or not password:
             return jsonify({"success": False, "error": "Email and password are required"}), 400
 
-        # Check if user already exists
-        if db.users.find_one({'email': email}):
-            return jsonify({"success": False, "error": "User already exists. Please log in instead."}), 409
+        limited = auth_rate_limited(email)
+        if limited:
+            return limited
             
         # Hash the password before saving it
-        hashed_password = generate_password_hash(password)
+        hashed_password = password_hasher.hash(password)
         
-        db.users.insert_one({
+        # The unique index on email rejects existing users atomically
+        storage.insert_user({
             'email': email,
             'password': hashed_password, 
             'created_at': datetime.utcnow()
@@ -97,14 +549,20 @@ def register_user():
         
         return jsonify({"success": True, "message": "User registered successfully", "userId": email}), 201
         
+    except DuplicateUserError:
+        return jsonify({"success": False, "error": "User already exists. Please log in instead."}), 409
+    except HasherBusyError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route('/api/auth/login', methods=['POST'])
 def login_user():
     try:
-        if not MONGODB_ENABLED:
-            return jsonify({"success": False, "error": "MongoDB not configured"}), 400
+        if not STORAGE_ENABLED:
+            return jsonify({"success": False, "error": "Storage not configured"}), 400
+        if not storage.ready:
+            return storage_not_ready()
             
         data = request.json
         email = data.get('email').lower()
@@ -113,15 +571,21 @@ def login_user():
         if not email or not password:
             return jsonify({"success": False, "error": "Email and password are required"}), 400
 
+        limited = auth_rate_limited(email)
+        if limited:
+            return limited
+
         # Retrieve user by email only
-        user = db.users.find_one({'email': email})
+        user = storage.find_user(email)
         
         # Verify password hash
-        if user and check_password_hash(user['password'], password):
+        if user and password_hasher.verify(user['password'], password):
             return jsonify({"success": True, "message": "Login successful", "userId": email}), 200
         else:
             return jsonify({"success": False, "error": "Invalid email or password"}), 401
             
+    except HasherBusyError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -129,62 +593,92 @@ def login_user():
 # MULTIMODAL AI
 # ============================================
 
+def read_image_request():
+    """Return (image source, params) for a multimodal request.
+
+    Accepts the original JSON body with a base64 data-URL in 'image', a
+    multipart form with an 'image' file part, or a raw image body
+    (application/octet-stream or image/*) with parameters in the query string.
+    Binary bodies are read in chunks straight into a buffer PIL decodes from.
+    """
+    if request.content_length and request.content_length > MAX_IMAGE_UPLOAD_BYTES:
+        raise ImageTooLargeError(f"Image larger than {MAX_IMAGE_UPLOAD_BYTES} bytes")
+    
+    content_type = request.mimetype or ''
+    if content_type == 'multipart/form-data':
+        file = request.files.get('image')
+        if file is None:
+            raise ValueError("No image provided")
+        return read_limited(file.stream, MAX_IMAGE_UPLOAD_BYTES), request.form
+    if content_type == 'application/octet-stream' or content_type.startswith('image/'):
+        return read_limited(request.stream, MAX_IMAGE_UPLOAD_BYTES), request.args
+    
+    data = request.json
+    image_base64 = data.get('image')
+    return base64.b64decode(image_base64.split(',')[1]), data
+
 @app.route('/api/multimodal/analyze-image', methods=['POST'])
+@admitted()
 def analyze_image():
     """Analyze screenshots/images with multimodal Gemini"""
     try:
         if not GEMINI_ENABLED:
             return jsonify({"success": False, "error": "Gemini API not configured"}), 400
             
-        data = request.json
-        image_base64 = data.get('image')
+        image_source, data = read_image_request()
         user_query = data.get('query', 'Analyze this image')
         accessibility_mode = data.get('accessibilityMode')
         
-        # MODEL: gemini-2.0-flash-lite
-        model = genai.GenerativeModel('gemini-2.0-flash-lite')
+        model = model_registry.get()
         
         if accessibility_mode:
             prompt = build_accessibility_prompt(user_query, accessibility_mode)
         else:
             prompt = user_query
         
-        # Decode image
-        image_data = base64.b64decode(image_base64.split(',')[1])
-        image = Image.open(io.BytesIO(image_data))
+        # Downscale and re-encode the image before it goes to the model
+        # Near-duplicate matching (if enabled) never crosses users
+        user_id = data.get('userId')
+        scope = f"user:{user_id}" if user_id and user_id != 'anonymous' else f"ip:{request.remote_addr}"
+        prepared = prepare_image(image_source, 'analysis', image_hash_index, scope)
         
-        response = model.generate_content([prompt, image])
+        analysis = generate_with_image(model, prompt, prepared)
         
         # Log usage
         log_usage(data.get('userId', 'anonymous'), 'multimodal_image_analysis', {
             'query': user_query,
-            'accessibility_mode': accessibility_mode
+            'accessibility_mode': accessibility_mode,
+            'image_bytes_saved': prepared.bytes_saved
         })
         
         return jsonify({
             "success": True,
-            "analysis": response.text,
+            "analysis": analysis,
             "source": "cloud-gemini-vision",
-            "accessibility_mode": accessibility_mode
+            "accessibility_mode": accessibility_mode,
+            "image": prepared.report()
         }), 200
         
+    except ImageTooLargeError as e:
+        return jsonify({"success": False, "error": str(e)}), 413
+    except (ModelBusyError, ModelTimeoutError) as e:
+        return model_unavailable(e)
     except Exception as e:
         # Catching generic Exception covers all SDK errors without needing specific imports
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route('/api/multimodal/ocr-translate', methods=['POST'])
+@admitted()
 def ocr_translate():
     """Extract text from images and translate"""
     try:
         if not GEMINI_ENABLED:
             return jsonify({"success": False, "error": "Gemini API not configured"}), 400
             
-        data = request.json
-        image_base64 = data.get('image')
+        image_source, data = read_image_request()
         target_language = data.get('targetLanguage', 'English')
         
-        # MODEL: gemini-2.0-flash-lite
-        model = genai.GenerativeModel('gemini-2.0-flash-lite')
+        model = model_registry.get()
         
         prompt = f"""
         Extract all text from this image and translate it to {target_language}.
@@ -197,19 +691,25 @@ def ocr_translate():
         [translated text]
         """
         
-        image_data = base64.b64decode(image_base64.split(',')[1])
-        image = Image.open(io.BytesIO(image_data))
+        prepared = prepare_image(image_source, 'ocr')
         
-        response = model.generate_content([prompt, image])
+        result = generate_with_image(model, prompt, prepared)
         
-        log_usage(data.get('userId', 'anonymous'), 'ocr_translate')
+        log_usage(data.get('userId', 'anonymous'), 'ocr_translate', {
+            'image_bytes_saved': prepared.bytes_saved
+        })
         
         return jsonify({
             "success": True,
-            "result": response.text,
-            "source": "cloud-gemini-ocr"
+            "result": result,
+            "source": "cloud-gemini-ocr",
+            "image": prepared.report()
         }), 200
         
+    except ImageTooLargeError as e:
+        return jsonify({"success": False, "error": str(e)}), 413
+    except (ModelBusyError, ModelTimeoutError) as e:
+        return model_unavailable(e)
     except Exception as e:
         # Catching generic Exception covers all SDK errors without needing specific imports
         return jsonify({"success": False, "error": str(e)}), 500
@@ -224,38 +724,45 @@ def hybrid_prompt():
     try:
         data = request.json
         prompt = data.get('prompt')
-        use_cloud = data.get('useCloud', False)
         accessibility_mode = data.get('accessibilityMode')
         
-        # Use cloud for long prompts or when explicitly requested
-        if use_cloud or len(prompt) > 3000:
+        # Use cloud when requested, for prompts beyond the on-device context, or when on-device is slower
+        routing = route_hybrid('prompt', prompt, data)
+        if routing['target'] == CLOUD:
             if not GEMINI_ENABLED:
                 return jsonify({
                     "success": False,
-                    "error": "Cloud AI not available. Prompt too long for on-device processing."
+                    "error": "Cloud AI not available. Prompt too long for on-device processing.",
+                    "routing": routing
                 }), 400
             
-            # Truncate the prompt to 10000 characters for the cloud API
-            MAX_PROMPT_LENGTH = 10000 
-            if len(prompt) > MAX_PROMPT_LENGTH:
-                # Truncate the content part of the prompt
-                prompt = prompt[:MAX_PROMPT_LENGTH] + "\n\n[Content truncated to fit API limit.]"
-            
-            # MODEL: gemini-2.0-flash-lite
-            model = genai.GenerativeModel('gemini-2.0-flash-lite')
-            
-            if accessibility_mode:
-                prompt = build_accessibility_prompt(prompt, accessibility_mode)
-            
-            response = model.generate_content(prompt)
-            
-            log_usage(data.get('userId', 'anonymous'), 'hybrid_prompt_cloud')
+            # Only the cloud branch calls the model, so only it goes through admission control
+            def cloud_response():
+                # Fit the prompt to the cloud token budget, cutting at a sentence boundary
+                cloud_prompt = hybrid_router.prepare_cloud_text('prompt', prompt, routing)
+                
+                model = model_registry.get()
+                
+                if accessibility_mode:
+                    cloud_prompt = build_accessibility_prompt(cloud_prompt, accessibility_mode)
+                
+                observe = cloud_latency_observer('prompt', routing)
+                if wants_stream(data):
+                    return stream_generation(model, cloud_prompt, accessibility_mode, data.get('userId', 'anonymous'), 'hybrid_prompt_cloud',
+                                             observe=observe, done_extra={"routing": routing})
+                
+                response_text = generate_cached(model, cloud_prompt, accessibility_mode, observe=observe)
+                
+                log_usage(data.get('userId', 'anonymous'), 'hybrid_prompt_cloud')
+                
+                return jsonify({
+                    "success": True,
+                    "response": response_text,
+                    "source": "cloud",
+                    "routing": routing
+                }), 200
             
-            return jsonify({
-                "success": True,
-                "response": response.text,
-                "source": "cloud"
-            }), 200
+            return run_admitted(cloud_response)
         else:
             # Instruct client to use on-device
             log_usage(data.get('userId', 'anonymous'), 'hybrid_prompt_ondevice')
@@ -263,9 +770,12 @@ def hybrid_prompt():
             return jsonify({
                 "success": True,
                 "source": "on-device",
-                "instruction": "use_prompt_api"
+                "instruction": "use_prompt_api",
+                "routing": routing
             }), 200
         
+    except (ModelBusyError, ModelTimeoutError) as e:
+        return model_unavailable(e)
     except Exception as e:
         # Catching generic Exception covers all SDK errors without needing specific imports
         return jsonify({"success": False, "error": str(e)}), 500
@@ -276,49 +786,115 @@ def hybrid_simplify():
     try:
         data = request.json
         text = data.get('text')
-        use_cloud = data.get('useCloud', False)
         accessibility_mode = data.get('accessibilityMode')
         
-        # Use cloud for long content
-        if use_cloud or len(text) > 5000:
+        # Use cloud for long content, or when on-device is slower or failing
+        routing = route_hybrid('simplify', text, data)
+        if routing['target'] == CLOUD:
             if not GEMINI_ENABLED:
                 return jsonify({
                     "success": False,
-                    "error": "Cloud AI not available. Text too long for on-device processing."
+                    "error": "Cloud AI not available. Text too long for on-device processing.",
+                    "routing": routing
                 }), 400
             
-            # MODEL: gemini-2.0-flash-lite
-            model = genai.GenerativeModel('gemini-2.0-flash-lite')
-            
-            # REMOVED: {accessibility_mode or 'general'} since 'general' mode is not needed
-            prompt = f"Simplify this text for someone with specific reading needs. The simplified response must be in the same language as the input text:\n\n{text}"
-            
-            if accessibility_mode == 'dyslexia':
-                prompt += "\n\nUse short sentences, simple words, and bullet points."
-            elif accessibility_mode == 'adhd':
-                prompt += "\n\nUse concise chunks, numbered lists, and highlight key points."
-            
-            response = model.generate_content(prompt)
-            
-            log_usage(data.get('userId', 'anonymous'), 'simplify_cloud')
+            # Only the cloud branch calls the model, so only it goes through admission control
+            def cloud_response():
+                cloud_text = hybrid_router.prepare_cloud_text('simplify', text, routing)
+                model = model_registry.get()
+                
+                # REMOVED: {accessibility_mode or 'general'} since 'general' mode is not needed
+                prompt = f"Simplify this text for someone with specific reading needs. The simplified response must be in the same language as the input text:\n\n{cloud_text}"
+                
+                if accessibility_mode == 'dyslexia':
+                    prompt += "\n\nUse short sentences, simple words, and bullet points."
+                elif accessibility_mode == 'adhd':
+                    prompt += "\n\nUse concise chunks, numbered lists, and highlight key points."
+                
+                observe = cloud_latency_observer('simplify', routing)
+                if wants_stream(data):
+                    return stream_generation(model, prompt, accessibility_mode, data.get('userId', 'anonymous'), 'simplify_cloud',
+                                             observe=observe, done_extra={"routing": routing})
+                
+                simplified = generate_cached(model, prompt, accessibility_mode, observe=observe)
+                
+                log_usage(data.get('userId', 'anonymous'), 'simplify_cloud')
+                
+                return jsonify({
+                    "success": True,
+                    "simplified": simplified,
+                    "source": "cloud",
+                    "routing": routing
+                }), 200
             
-            return jsonify({
-                "success": True,
-                "simplified": response.text,
-                "source": "cloud"
-            }), 200
+            return run_admitted(cloud_response)
         else:
             log_usage(data.get('userId', 'anonymous'), 'simplify_ondevice')
             
             return jsonify({
                 "success": True,
-                "source": "on-device"
+                "source": "on-device",
+                "routing": routing
             }), 200
         
+    except (ModelBusyError, ModelTimeoutError) as e:
+        return model_unavailable(e)
     except Exception as e:
         # Catching generic Exception covers all SDK errors without needing specific imports
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/hybrid/telemetry', methods=['POST'])
+def hybrid_telemetry():
+    """Record on-device runs measured by the extension: {mode, latencyMs, success, tokens or characters}, or a list of them"""
+    payload = request.get_json(silent=True)
+    reports = payload if isinstance(payload, list) else [payload]
+    max_reports = min(EVENT_BATCH_MAX_EVENTS, HYBRID_TELEMETRY_REPORTS_PER_MINUTE or EVENT_BATCH_MAX_EVENTS)
+    if not reports or len(reports) > max_reports:
+        return jsonify({"success": False, "error": f"Expected 1 to {max_reports} reports"}), 400
+    # Keyed on the client IP: userId is whatever the client says it is
+    wait = telemetry_limiter.take(request.remote_addr, len(reports)) if HYBRID_TELEMETRY_REPORTS_PER_MINUTE else 0
+    if wait:
+        response = jsonify({"success": False, "error": "Too many telemetry reports. Please slow down."})
+        response.headers['Retry-After'] = str(math.ceil(wait))
+        return response, 429
+    
+    samples = []
+    for report in reports:
+        if not isinstance(report, dict) or report.get('mode') not in HYBRID_MODES:
+            return jsonify({"success": False, "error": f"mode must be one of {', '.join(HYBRID_MODES)}"}), 400
+        try:
+            latency_ms = float(report['latencyMs'])
+            tokens = int(report['tokens']) if 'tokens' in report else -(-int(report.get('characters', 0)) // 4)
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"success": False, "error": "latencyMs (and tokens or characters) must be numbers"}), 400
+        if not math.isfinite(latency_ms) or latency_ms < 0 or tokens < 0:
+            return jsonify({"success": False, "error": "latencyMs and tokens must not be negative"}), 400
+        # On-device runs never see more than the on-device token limit
+        tokens = min(tokens, hybrid_router.on_device_max_tokens[report['mode']])
+        latency_ms = min(latency_ms, HYBRID_TELEMETRY_MAX_LATENCY_MS)
+        samples.append((report['mode'], tokens, latency_ms / 1000, report.get('success', True) is not False))
+    
+    for mode, tokens, seconds, ok in samples:
+        hybrid_router.record(ON_DEVICE, mode, tokens, seconds, ok)
+    return jsonify({"success": True, "recorded": len(samples)}), 200
+
+def route_hybrid(mode, text, data):
+    """Route a hybrid request; onDeviceAvailable=false from the client rules out on-device"""
+    routing = hybrid_router.route(
+        mode,
+        text,
+        force_cloud=bool(data.get('useCloud', False)),
+        cloud_available=GEMINI_ENABLED,
+        on_device_available=data.get('onDeviceAvailable', True) is not False,
+    )
+    hybrid_routes.inc(mode=mode, target=routing['target'], reason=routing['reason'])
+    return routing
+
+def cloud_latency_observer(mode, routing):
+    """Callback recording an uncached cloud call's duration for future routing decisions"""
+    tokens = routing.get('sent_tokens', routing['estimated_tokens'])
+    return lambda seconds, ok: hybrid_router.record(CLOUD, mode, tokens, seconds, ok)
+
 # ============================================
 # LOGGING ENDPOINTS
 # ============================================
@@ -327,10 +903,7 @@ def hybrid_simplify():
 def proxy_proofread():
     try:
         data = request.json
-        log_usage(data.get('userId', 'anonymous'), 'proofread', {
-            'document_type': data.get('documentType'),
-            'text_length': len(data.get('text', ''))
-        })
+        log_usage(data.get('userId', 'anonymous'), 'proofread', USAGE_EVENT_METADATA['proofread'](data))
         return jsonify({"success": True}), 200
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -339,10 +912,7 @@ def proxy_proofread():
 def proxy_summarize():
     try:
         data = request.json
-        log_usage(data.get('userId', 'anonymous'), 'summarize', {
-            'url': data.get('url'),
-            'content_length': len(data.get('content', ''))
-        })
+        log_usage(data.get('userId', 'anonymous'), 'summarize', USAGE_EVENT_METADATA['summarize'](data))
         return jsonify({"success": True}), 200
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -351,14 +921,69 @@ def proxy_summarize():
 def proxy_translate():
     try:
         data = request.json
-        log_usage(data.get('userId', 'anonymous'), 'translate', {
-            'source_lang': data.get('sourceLanguage'),
-            'target_lang': data.get('targetLanguage')
-        })
+        log_usage(data.get('userId', 'anonymous'), 'translate', USAGE_EVENT_METADATA['translate'](data))
         return jsonify({"success": True}), 200
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/events/batch', methods=['POST'])
+def ingest_event_batch():
+    """Ingest a client-buffered batch of session and usage events (JSON, optionally gzip-compressed)"""
+    try:
+        # Reject on the declared length before reading anything; a chunked body is cut off at the same limit
+        if (request.content_length or 0) > request.max_content_length:
+            return jsonify({"success": False, "error": f"Batch larger than {EVENT_BATCH_MAX_BYTES} bytes"}), 413
+        try:
+            raw = request.get_data(cache=False)
+        except RequestEntityTooLarge:
+            return jsonify({"success": False, "error": f"Batch larger than {EVENT_BATCH_MAX_BYTES} bytes"}), 413
+        if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            try:
+                raw = decompressor.decompress(raw, EVENT_BATCH_MAX_BYTES + 1)
+            except zlib.error:
+                return jsonify({"success": False, "error": "Invalid gzip body"}), 400
+        if len(raw) > EVENT_BATCH_MAX_BYTES:
+            return jsonify({"success": False, "error": f"Batch larger than {EVENT_BATCH_MAX_BYTES} bytes"}), 413
+        try:
+            data = json.loads(raw or b'null')
+        except ValueError:
+            return jsonify({"success": False, "error": "Body is not valid JSON"}), 400
+        
+        events = data.get('events') if isinstance(data, dict) else data
+        if not isinstance(events, list):
+            return jsonify({"success": False, "error": "Expected a JSON array of events or {\"events\": [...]}"}), 400
+        if len(events) > EVENT_BATCH_MAX_EVENTS:
+            return jsonify({"success": False, "error": f"At most {EVENT_BATCH_MAX_EVENTS} events per batch"}), 413
+        
+        sessions = []
+        usage_logs = []
+        rejected = []
+        for index, event in enumerate(events):
+            try:
+                collection, doc = build_event_document(event)
+            except ValueError as e:
+                rejected.append({"index": index, "error": str(e)})
+                continue
+            (sessions if collection == 'sessions' else usage_logs).append(doc)
+        
+        # One bulk write per collection for the whole batch
+        if STORAGE_ENABLED and (sessions or usage_logs):
+            if not storage.ready:
+                return storage_not_ready()
+            if sessions:
+                storage.insert_sessions(sessions)
+            if usage_logs:
+                storage.insert_usage_logs(usage_logs)
+        
+        return jsonify({
+            "success": True,
+            "accepted": len(sessions) + len(usage_logs),
+            "rejected": rejected
+        }), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
 # ============================================
 # ACCESSIBILITY PROFILE MANAGEMENT (MongoDB) - Disabled for Privacy
 # ============================================
@@ -386,20 +1011,16 @@ def get_profile(user_id):
 def log_session():
     """Log learning session for analytics"""
     try:
-        if not MONGODB_ENABLED:
+        if not STORAGE_ENABLED:
             return jsonify({"success": True}), 200
+        if not storage.ready:
+            return storage_not_ready()
             
         data = request.json
         
-        session_data = {
-            'user_id': data.get('userId', 'anonymous'),
-            'document_type': data.get('documentType'),
-            'features_used': data.get('featuresUsed', []),
-            'duration': data.get('duration', 0),
-            'timestamp': datetime.utcnow()
-        }
+        session_data = build_session_document(data)
         
-        db.sessions.insert_one(session_data)
+        storage.insert_sessions([session_data])
         
         return jsonify({"success": True}), 200
         
@@ -410,12 +1031,14 @@ def log_session():
 def get_insights(user_id):
     """Generate AI insights from usage patterns"""
     try:
-        if not MONGODB_ENABLED:
+        if not STORAGE_ENABLED:
             return jsonify({
                 "success": True,
-                "insights": "Analytics not available (MongoDB not configured)",
+                "insights": "Analytics not available (storage not configured)",
                 "session_count": 0
             }), 200
+        if not storage.ready:
+            return storage_not_ready()
         
         if not GEMINI_ENABLED:
             return jsonify({
@@ -424,28 +1047,60 @@ def get_insights(user_id):
                 "session_count": 0
             }), 200
             
-        # Get last 30 sessions
-        sessions = list(db.sessions.find(
-            {'user_id': user_id}
-        ).sort('timestamp', -1).limit(30))
+        # Serve stored insights unless enough new sessions were logged since or they expired
+        watermark = storage.session_count(user_id)
+        stored = insights_store.get(storage, user_id)
+        if insights_store.is_fresh(stored, watermark):
+            return insights_response(stored, cached=True)
         
-        if not sessions:
-            return jsonify({
-                "success": True,
-                "insights": "Not enough data yet. Keep using ChromeAI Plus to unlock personalized insights!",
-                "session_count": 0
-            }), 200
+        # Only regeneration calls the model, so only it goes through admission control
+        if stored and insights_store.background:
+            key = admission_key()
+            
+            def refresh():
+                # A refresh that is not admitted is skipped; the stored insights keep being served
+                admission.acquire(key, BACKGROUND)
+                start = time.perf_counter()
+                try:
+                    generate_user_insights(user_id, watermark)
+                finally:
+                    admission.release(time.perf_counter() - start)
+            
+            insights_store.refresh_in_background(user_id, refresh)
+            return insights_response(stored, cached=True)
+        
+        def regenerate():
+            result = generate_user_insights(user_id, watermark)
+            if result is None:
+                return jsonify({
+                    "success": True,
+                    "insights": "Not enough data yet. Keep using ChromeAI Plus to unlock personalized insights!",
+                    "session_count": 0
+                }), 200
+            return insights_response(result, cached=False)
         
-        # Prepare data for analysis (remove MongoDB _id)
-        sessions_data = []
-        for session in sessions:
-            session.pop('_id', None)
-            session['timestamp'] = session['timestamp'].isoformat()
-            sessions_data.append(session)
+        return run_admitted(regenerate, BACKGROUND)
         
-        # MODEL: gemini-2.0-flash-lite
-        model = genai.GenerativeModel('gemini-2.0-flash-lite')
-        prompt = f"""Analyze these learning session patterns and provide personalized insights:
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def generate_user_insights(user_id, watermark):
+    """Generate insights from the user's recent sessions and store them; None if there are no sessions"""
+    # Get last 30 sessions
+    sessions = storage.recent_sessions(user_id, 30)
+    
+    if not sessions:
+        return None
+    
+    # Prepare data for analysis (remove MongoDB _id)
+    sessions_data = []
+    for session in sessions:
+        session.pop('_id', None)
+        session['timestamp'] = session['timestamp'].isoformat()
+        sessions_data.append(session)
+    
+    model = model_registry.get()
+    prompt = f"""Analyze these learning session patterns and provide personalized insights:
 
 {json.dumps(sessions_data[:10], indent=2)}
 
@@ -456,59 +1111,32 @@ Provide:
 4. Accessibility needs analysis
 
 Keep it concise and actionable."""
-        
-        response = model.generate_content(prompt)
-        
-        return jsonify({
-            "success": True,
-            "insights": response.text,
-            "session_count": len(sessions_data)
-        }), 200
-        
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    
+    insights = generate_cached(model, prompt)
+    return insights_store.save(storage, user_id, insights, len(sessions_data), watermark)
+
+def insights_response(stored, cached):
+    return jsonify({
+        "success": True,
+        "insights": stored['insights'],
+        "session_count": stored['session_count'],
+        "cached": cached,
+        "generated_at": datetime.fromtimestamp(stored['generated_at'], tz=timezone.utc).isoformat()
+    }), 200
 
 @app.route('/api/analytics/stats/<user_id>', methods=['GET'])
 def get_stats(user_id):
     """Get user statistics"""
     try:
-        if not MONGODB_ENABLED:
-            return jsonify({"success": False, "error": "MongoDB not configured"}), 400
+        if not STORAGE_ENABLED:
+            return jsonify({"success": False, "error": "Storage not configured"}), 400
+        if not storage.ready:
+            return storage_not_ready()
             
-        # Count total sessions
-        total_sessions = db.sessions.count_documents({'user_id': user_id})
-        
-        # Get feature usage counts
-        pipeline = [
-            {'$match': {'user_id': user_id}},
-            {'$unwind': '$features_used'},
-            {'$group': {
-                '_id': '$features_used',
-                'count': {'$sum': 1}
-            }},
-            {'$sort': {'count': -1}}
-        ]
-        
-        feature_usage = list(db.sessions.aggregate(pipeline))
-        
-        # Get document type distribution
-        doc_pipeline = [
-            {'$match': {'user_id': user_id}},
-            {'$group': {
-                '_id': '$document_type',
-                'count': {'$sum': 1}
-            }},
-            {'$sort': {'count': -1}}
-        ]
-        
-        doc_types = list(db.sessions.aggregate(doc_pipeline))
+        # Session, feature and document type counts are pre-aggregated on ingest
+        stats = storage.user_stats(user_id)
         
-        return jsonify({
-            "success": True,
-            "total_sessions": total_sessions,
-            "feature_usage": feature_usage,
-            "document_types": doc_types
-        }), 200
+        return jsonify({"success": True, **stats}), 200
         
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -526,56 +1154,219 @@ def build_accessibility_prompt(query, mode):
     }
     return prompts.get(mode, query)
 
+def generate_cached(model, prompt, accessibility_mode=None, observe=None):
+    """Run a text-only Gemini call, serving repeats of the same model/prompt/mode from the response cache.
+
+    observe(seconds, ok), if given, is called with the duration of an actual model call (not cache hits).
+    """
+    key = make_key(model.model_name, prompt, accessibility_mode)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    def call_model():
+        start = time.perf_counter()
+        try:
+            text = model_registry.generate(model, prompt).text
+        except Exception:
+            if observe:
+                observe(time.perf_counter() - start, False)
+            raise
+        if observe:
+            observe(time.perf_counter() - start, True)
+        response_cache.set(key, text)
+        return text
+    
+    return model_gate.call(key, call_model)
+
+def wants_stream(data):
+    """True when the client asked for a Server-Sent Events response instead of JSON"""
+    return bool(data.get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def stream_generation(model, prompt, accessibility_mode, user_id, feature, observe=None, done_extra=None):
+    """Stream a Gemini response as Server-Sent Events, recording time-to-first-byte.
+
+    Emits 'chunk' events ({"text": ...}) as output arrives, then a 'done' event
+    with timings (plus done_extra), or an 'error' event. Completed responses are
+    added to the response cache, and a cached response is replayed as a single
+    chunk. observe(seconds, ok) is called when an uncached stream ends.
+    """
+    key = make_key(model.model_name, prompt, accessibility_mode)
+    cached = response_cache.get(key)
+    if cached is None:
+        # Hold an in-flight slot for the whole stream; released when the response closes
+        model_gate.acquire()
+    start = time.perf_counter()
+    released = threading.Event()
+    release_lock = threading.Lock()
+    
+    def release_slot():
+        with release_lock:
+            if cached is None and not released.is_set():
+                released.set()
+                model_gate.release()
+    
+    def events():
+        ttfb_ms = None
+        parts = []
+        try:
+            chunks = [cached] if cached is not None else model_registry.stream(model, prompt)
+            for text in chunks:
+                if ttfb_ms is None:
+                    ttfb_ms = round((time.perf_counter() - start) * 1000, 1)
+                parts.append(text)
+                yield _sse('chunk', {"text": text})
+            release_slot()
+            if cached is None:
+                response_cache.set(key, "".join(parts))
+                if observe:
+                    observe(time.perf_counter() - start, True)
+            total_ms = round((time.perf_counter() - start) * 1000, 1)
+            log_usage(user_id, feature, {'stream': True, 'cached': cached is not None, 'ttfb_ms': ttfb_ms, 'total_ms': total_ms})
+            yield _sse('done', {"success": True, "source": "cloud", "ttfb_ms": ttfb_ms, "total_ms": total_ms, **(done_extra or {})})
+        except Exception as e:
+            if cached is None and observe:
+                observe(time.perf_counter() - start, False)
+            yield _sse('error', {"success": False, "error": str(e)})
+        finally:
+            release_slot()
+    
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(release_slot)
+    return response
+
+def generate_with_image(model, prompt, prepared):
+    """Run a multimodal Gemini call on a prepared image, cached and coalesced on the prompt plus image fingerprint"""
+    key = make_key(model.model_name, f"{prompt}\n[image:{prepared.cache_token}]")
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    def call_model():
+        text = model_registry.generate(model, [prompt, prepared.part]).text
+        response_cache.set(key, text)
+        return text
+    
+    return model_gate.call(key, call_model)
+
+def build_session_document(data, timestamp=None):
+    """Shape a client session payload into a sessions document"""
+    return {
+        'user_id': data.get('userId', 'anonymous'),
+        'document_type': data.get('documentType'),
+        'features_used': data.get('featuresUsed', []),
+        'duration': data.get('duration', 0),
+        'timestamp': timestamp or datetime.utcnow()
+    }
+
+# Metadata recorded for each usage event type logged by the /api/proxy/* endpoints
+USAGE_EVENT_METADATA = {
+    'proofread': lambda data: {
+        'document_type': data.get('documentType'),
+        'text_length': len(data.get('text', ''))
+    },
+    'summarize': lambda data: {
+        'url': data.get('url'),
+        'content_length': len(data.get('content', ''))
+    },
+    'translate': lambda data: {
+        'source_lang': data.get('sourceLanguage'),
+        'target_lang': data.get('targetLanguage')
+    },
+}
+
+def parse_event_timestamp(value):
+    """Parse a client event time (epoch milliseconds or ISO 8601) into naive UTC, capped at now"""
+    now = datetime.utcnow()
+    if value is None:
+        return now
+    if isinstance(value, bool):
+        raise ValueError("invalid timestamp")
+    if isinstance(value, (int, float)):
+        parsed = datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+    elif isinstance(value, str):
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    else:
+        raise ValueError("invalid timestamp")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return min(parsed, now)
+
+def build_event_document(event):
+    """Validate one batched event and return (collection name, document)"""
+    if not isinstance(event, dict):
+        raise ValueError("event must be an object")
+    event_type = event.get('type')
+    user_id = event.get('userId', 'anonymous')
+    if not isinstance(user_id, str) or not user_id:
+        raise ValueError("userId must be a non-empty string")
+    try:
+        timestamp = parse_event_timestamp(event.get('timestamp'))
+    except (ValueError, OverflowError, OSError):
+        raise ValueError("timestamp must be epoch milliseconds or an ISO 8601 string")
+    
+    if event_type == 'session':
+        features = event.get('featuresUsed', [])
+        if not isinstance(features, list) or not all(isinstance(f, str) for f in features):
+            raise ValueError("featuresUsed must be a list of strings")
+        duration = event.get('duration', 0)
+        if isinstance(duration, bool) or not isinstance(duration, (int, float)):
+            raise ValueError("duration must be a number")
+        return 'sessions', build_session_document(event, timestamp)
+    
+    if event_type in USAGE_EVENT_METADATA:
+        for field in ('text', 'content'):
+            if field in event and not isinstance(event[field], str):
+                raise ValueError(f"{field} must be a string")
+        return 'usage_logs', {
+            'user_id': user_id,
+            'feature': event_type,
+            'metadata': USAGE_EVENT_METADATA[event_type](event),
+            'timestamp': timestamp
+        }
+    
+    raise ValueError(f"unknown event type: {event_type!r}")
+
 def log_usage(user_id, feature, metadata=None):
-    """Log feature usage to MongoDB"""
+    """Queue a feature usage log for the background storage writer"""
     try:
-        if MONGODB_ENABLED:
+        if STORAGE_ENABLED:
             log_data = {
                 'user_id': user_id,
                 'feature': feature,
                 'metadata': metadata or {},
                 'timestamp': datetime.utcnow()
             }
-            db.usage_logs.insert_one(log_data)
+            usage_logger.enqueue(log_data)
     except Exception as e:
         print(f"Failed to log usage: {e}")
 
-def extract_text_from_pdf(path):
-    text_parts = []
-    try:
-        with open(path, 'rb') as fh:
-            reader = PyPDF2.PdfReader(fh)
-            for p in reader.pages:
-                try:
-                    text_parts.append(p.extract_text() or "")
-                except Exception:
-                    continue
-    except Exception as e:
-        return ""
-    return "\n".join(text_parts)
-
-def extract_text_from_docx(path):
-    """Extract text from Word document (.docx)"""
-    try:
-        doc = Document(path)
-        text_parts = []
-        for paragraph in doc.paragraphs:
-            if paragraph.text.strip():
-                text_parts.append(paragraph.text.strip())
-        return "\n".join(text_parts)
-    except Exception as e:
-        return ""
-
 def summarize_with_gemini(text):
     """Summarize text using Gemini 2.0 Flash Lite"""
     if not GEMINI_ENABLED:
         return None
     
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash-lite')
-        prompt = f"Summarize the following document into a concise summary:\n\n{text[:30000]}"
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        model = model_registry.get()
+        if len(text) <= SUMMARY_CHUNK_CHARS:
+            prompt = f"Summarize the following document into a concise summary:\n\n{text}"
+            return generate_cached(model, prompt).strip()
+        
+        # Each chunk prompt is cached on its own, so an edited document only re-summarizes changed chunks
+        def summarize_chunk(chunk):
+            prompt = f"Summarize the following section of a longer document into a concise summary. Keep key facts, names and figures:\n\n{chunk}"
+            return generate_cached(model, prompt).strip()
+        
+        def combine(summaries):
+            prompt = f"The following are summaries of consecutive sections of one document. Combine them into a single concise summary of the whole document:\n\n{summaries}"
+            return generate_cached(model, prompt).strip()
+        
+        return map_reduce_summarize(text, summarize_chunk, combine, summary_executor, SUMMARY_CHUNK_CHARS)
     except Exception as e:
         print(f"Gemini summarization error: {e}")
         return None
@@ -586,13 +1377,12 @@ def proofread_with_gemini(text):
         return None
     
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash-lite')
+        model = model_registry.get()
         prompt = f"""Please proofread the following text for grammar, spelling, punctuation, and style improvements. 
 Provide the corrected version and highlight any major issues found:
 
 {text[:30000]}"""
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        return generate_cached(model, prompt).strip()
     except Exception as e:
         print(f"Gemini proofreading error: {e}")
         return None
@@ -608,22 +1398,58 @@ def upload_document():
         if file.filename == '':
             return jsonify({"error": "No file selected"}), 400
         
-        # Check file extension
-        filename_lower = file.filename.lower()
-        if not (filename_lower.endswith('.pdf') or filename_lower.endswith('.docx')):
+        # Type, size and magic bytes were checked while streaming; store under the content hash
+        upload = file.stream
+        if not isinstance(upload, HashingFileStream):
             return jsonify({"error": "Only PDF and Word (.docx) files are allowed"}), 400
-        
-        # Secure the filename and save the file
-        filename = secure_filename(file.filename)
+        filename, digest = upload.store(app.config['UPLOAD_FOLDER'])
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
         
-        return jsonify({"filename": filename}), 200
+        # Warm the extraction cache so the first summarize/proofread skips parsing
+        schedule_extraction_warmup(filepath, digest)
         
+        return jsonify({
+            "filename": filename,
+            "originalName": secure_filename(file.filename),
+            "size": upload.size,
+            "sha256": digest
+        }), 200
+        
+    except UploadRejected as e:
+        return jsonify({"error": str(e)}), e.status
+    except RequestEntityTooLarge:
+        return jsonify({"error": f"File larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"}), 413
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def schedule_extraction_warmup(path, digest):
+    """Queue a background extraction of an uploaded document unless its text is cached or already queued"""
+    budget = summary_text_budget()
+    if extraction_cache.has(digest) or extraction_cache.has(f"{digest}-{budget}"):
+        return False
+    with _warmup_lock:
+        if digest in _warmup_pending or len(_warmup_pending) >= UPLOAD_WARMUP_MAX_PENDING:
+            return False
+        _warmup_pending.add(digest)
+    
+    def warm():
+        try:
+            get_document_text(path, budget)
+        except Exception as e:
+            print(f"Extraction warm-up failed: {e}")
+        finally:
+            with _warmup_lock:
+                _warmup_pending.discard(digest)
+    
+    upload_warmup_executor.submit(warm)
+    return True
+
+def summary_text_budget():
+    """Characters of document text to extract for summarization"""
+    return SUMMARY_MAX_CHARS if GEMINI_ENABLED else DOCUMENT_TEXT_BUDGET
+
 @app.route('/summarize', methods=['POST'])
+@admitted()
 def summarize_pdf():
     data = request.get_json() or {}
     filename = data.get('filename')
@@ -632,24 +1458,16 @@ def summarize_pdf():
     path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
     if not os.path.exists(path):
         return jsonify({"error": "file not found"}), 404
-    text = extract_text_from_pdf(path)
+    text = get_document_text(path, summary_text_budget())
     if not text:
         return jsonify({"error": "no text extracted"}), 500
-    summary = None
-    if GEMINI_ENABLED:
-        try:
-            summary = summarize_with_gemini(text)
-        except Exception:
-            summary = None
-    if not summary:
-        summary = text.strip()[:2000]
-        if len(text) > 2000:
-            summary += "\n\n[Truncated preview. Add GOOGLE_AI_API_KEY in backend .env for better summaries.]"
+    summary = summarize_document_text(text)
     return jsonify({"summary": summary}), 200
 
 @app.route('/proofread', methods=['POST'])
+@admitted()
 def proofread_pdf():
-    """Proofread PDF content for grammar, spelling, and style"""
+    """Proofread document content (PDF or Word) for grammar, spelling, and style"""
     data = request.get_json() or {}
     filename = data.get('filename')
     if not filename:
@@ -657,33 +1475,82 @@ def proofread_pdf():
     path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
     if not os.path.exists(path):
         return jsonify({"error": "file not found"}), 404
-    text = extract_text_from_pdf(path)
+    text = get_document_text(path, DOCUMENT_TEXT_BUDGET)
     if not text:
         return jsonify({"error": "no text extracted"}), 500
     
-    proofread_result = None
-    if GEMINI_ENABLED:
-        try:
-            proofread_result = proofread_with_gemini(text)
-        except Exception:
-            proofread_result = None
-    if not proofread_result:
-        # Fallback: basic text analysis
-        proofread_result = f"Text extracted from PDF:\n\n{text[:1000]}\n\n[Add GOOGLE_AI_API_KEY in backend .env for AI-powered proofreading.]"
+    file_type = "PDF" if filename.lower().endswith('.pdf') else "Word document"
+    proofread_result = proofread_document_text(text, file_type)
     
     return jsonify({"proofread": proofread_result}), 200
 
-def extract_text_from_document(path):
-    """Extract text from document based on file extension"""
+def extract_document_text(path, max_chars=None):
+    """Extract a PDF or Word document's text, or only as many pages/paragraphs as fill max_chars.
+
+    Returns (text, complete). complete is False when extraction failed part-way
+    (an error, or PDF pages lost to timeouts), so the text may be truncated.
+    """
     filename_lower = path.lower()
     if filename_lower.endswith('.pdf'):
-        return extract_text_from_pdf(path)
-    elif filename_lower.endswith('.docx'):
-        return extract_text_from_docx(path)
-    else:
-        return ""
+        # Large PDFs fan out to the extraction pool until the budget is met
+        try:
+            text, complete = pdf_extractor.extract_text(path, max_chars)
+        except Exception as e:
+            return "", False
+        return (text[:max_chars] if max_chars else text), complete
+    if not filename_lower.endswith('.docx'):
+        return "", True
+    text_parts = []
+    total = 0
+    complete = True
+    try:
+        for piece in iter_docx_blocks(path):
+            text_parts.append(piece)
+            total += len(piece) + 1
+            if max_chars and total >= max_chars:
+                break
+    except Exception as e:
+        complete = False
+    text = "\n".join(text_parts)
+    return (text[:max_chars] if max_chars else text), complete
+
+def timed_extraction(path, max_chars=None):
+    """extract_document_text, recording the time in the extraction metrics"""
+    doc_format = os.path.splitext(path)[1].lstrip('.').lower()
+    with extraction_latency.time(format=doc_format, mode='prefix' if max_chars else 'full'):
+        return extract_document_text(path, max_chars)
+
+def get_document_text(path, max_chars=None):
+    """Extract document text, reusing the content-hash cache when the same file was seen before.
+
+    With max_chars, only the leading part of the document is parsed (unless the
+    full text is already cached) and at most max_chars characters are returned.
+    """
+    try:
+        digest = extraction_cache.digest(path)
+        text = extraction_cache.get(digest)
+        if text is None and max_chars:
+            text = extraction_cache.get(f"{digest}-{max_chars}")
+    except Exception as e:
+        print(f"Extraction cache lookup failed: {e}")
+        return timed_extraction(path, max_chars)[0]
+    if text is None:
+        text, complete = timed_extraction(path, max_chars)
+        if max_chars:
+            # A prefix that came up short of the budget is the whole document
+            cache_key = digest if len(text) < max_chars - 1 else f"{digest}-{max_chars}"
+        else:
+            cache_key = digest
+        # Text from an extraction that failed part-way is served but not cached
+        if text and complete:
+            try:
+                extraction_cache.put(cache_key, text)
+            except Exception as e:
+                print(f"Extraction cache write failed: {e}")
+    return text[:max_chars] if max_chars else text
 
 @app.route('/process-document', methods=['POST'])
+@admitted()
 def process_document():
     """Process document with multiple options: summarize, proofread, or both (PDF or Word)"""
     data = request.get_json() or {}
@@ -696,7 +1563,17 @@ def process_document():
     if not os.path.exists(path):
         return jsonify({"error": "file not found"}), 404
     
-    text = extract_text_from_document(path)
+    if data.get('async'):
+        try:
+            job_id = job_queue.submit('process-document', run_document_job, {'path': path, 'filename': filename, 'action': action})
+        except JobQueueFull as e:
+            response = jsonify({"success": False, "error": str(e)})
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, 429
+        return jsonify({"jobId": job_id, "status": "queued", "statusUrl": f"/jobs/{job_id}"}), 202
+    
+    budget = summary_text_budget() if action in ['summarize', 'both'] else DOCUMENT_TEXT_BUDGET
+    text = get_document_text(path, budget)
     file_type = "PDF" if filename.lower().endswith('.pdf') else "Word document"
     if not text:
         return jsonify({"error": f"No text extracted from {file_type}. The file may be corrupt, protected, or contains complex formatting that prevented reading."}), 400
@@ -704,31 +1581,154 @@ def process_document():
     result = {}
     
     if action in ['summarize', 'both']:
-        summary = None
-        if GEMINI_ENABLED:
-            try:
-                summary = summarize_with_gemini(text)
-            except Exception:
-                summary = None
-        if not summary:
-            summary = text.strip()[:2000]
-            if len(text) > 2000:
-                summary += "\n\n[Truncated preview. Add GOOGLE_AI_API_KEY in backend .env for better summaries.]"
-        result['summary'] = summary
+        result['summary'] = summarize_document_text(text)
     
     if action in ['proofread', 'both']:
-        proofread_result = None
-        if GEMINI_ENABLED:
-            try:
-                proofread_result = proofread_with_gemini(text)
-            except Exception:
-                proofread_result = None
-        if not proofread_result:
-            file_type = "PDF" if filename.lower().endswith('.pdf') else "Word document"
-            proofread_result = f"Text extracted from {file_type}:\n\n{text[:1000]}\n\n[Add GOOGLE_AI_API_KEY in backend .env for AI-powered proofreading.]"
-        result['proofread'] = proofread_result
+        result['proofread'] = proofread_document_text(text, file_type)
     
     return jsonify(result), 200
 
+def summarize_document_text(text):
+    """Summarize extracted document text, falling back to a truncated preview"""
+    summary = None
+    if GEMINI_ENABLED:
+        try:
+            summary = summarize_with_gemini(text)
+        except Exception:
+            summary = None
+    if not summary:
+        summary = text.strip()[:2000]
+        if len(text) > 2000:
+            if GEMINI_ENABLED:
+                summary += "\n\n[Truncated preview. The AI service is temporarily unavailable; try again shortly for a full summary.]"
+            else:
+                summary += "\n\n[Truncated preview. Add GOOGLE_AI_API_KEY in backend .env for better summaries.]"
+    return summary
+
+def proofread_document_text(text, file_type):
+    """Proofread extracted document text, falling back to the raw extracted text"""
+    proofread_result = None
+    if GEMINI_ENABLED:
+        try:
+            proofread_result = proofread_with_gemini(text)
+        except Exception:
+            proofread_result = None
+    if not proofread_result:
+        note = ("The AI service is temporarily unavailable; try again shortly for AI-powered proofreading." if GEMINI_ENABLED
+                else "Add GOOGLE_AI_API_KEY in backend .env for AI-powered proofreading.")
+        proofread_result = f"Text extracted from {file_type}:\n\n{text[:1000]}\n\n[{note}]"
+    return proofread_result
+
+def run_document_job(job_id, path, filename, action):
+    """Job body for async /process-document: extract once, then summarize and proofread concurrently"""
+    job_queue.update(job_id, stage='extracting')
+    budget = summary_text_budget() if action in ['summarize', 'both'] else DOCUMENT_TEXT_BUDGET
+    text = get_document_text(path, budget)
+    file_type = "PDF" if filename.lower().endswith('.pdf') else "Word document"
+    if not text:
+        raise ValueError(f"No text extracted from {file_type}. The file may be corrupt, protected, or contains complex formatting that prevented reading.")
+    
+    job_queue.update(job_id, stage='processing')
+    futures = {}
+    if action in ['summarize', 'both']:
+        futures['summary'] = job_task_executor.submit(summarize_document_text, text)
+    if action in ['proofread', 'both']:
+        futures['proofread'] = job_task_executor.submit(proofread_document_text, text, file_type)
+    
+    # Publish each part as soon as it is ready so pollers see partial results
+    for future in as_completed(futures.values()):
+        name = next(key for key, value in futures.items() if value is future)
+        job_queue.update(job_id, result={name: future.result()})
+    return None
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll a background job's status and (partial) results"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "job not found"}), 404
+    return jsonify({"success": True, "job": public_job(job)}), 200
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Subscribe to a background job's progress as Server-Sent Events"""
+    if job_queue.get(job_id) is None:
+        return jsonify({"success": False, "error": "job not found"}), 404
+    
+    def events():
+        last_seen = None
+        deadline = time.time() + JOB_TTL
+        while time.time() < deadline:
+            job = job_queue.get(job_id)
+            if job is None:
+                yield _sse('error', {"success": False, "error": "job expired"})
+                return
+            if job['updated_at'] != last_seen:
+                last_seen = job['updated_at']
+                yield _sse('status', public_job(job))
+            if job['status'] in FINISHED:
+                return
+            time.sleep(0.5)
+    
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def public_job(job):
+    return {
+        "id": job['id'],
+        "status": job['status'],
+        "stage": job['stage'],
+        "result": job['result'],
+        "error": job['error'],
+        "createdAt": job['created_at'],
+        "updatedAt": job['updated_at']
+    }
+
+# ============================================
+# STARTUP
+# ============================================
+
+# Heavy SDKs are imported on first use; with WARM_IMPORTS on, a background thread loads them right
+# after start-up so the first request that needs one does not pay the import
+WARM_IMPORTS = os.getenv('WARM_IMPORTS', '1') not in ('0', 'false', 'False')
+_services_started = False
+_services_lock = threading.Lock()
+
+def _warm_imports():
+    modules = ['PyPDF2', 'PIL.Image', 'PIL.ImageOps']
+    if GEMINI_ENABLED and GEMINI_BACKEND != 'stub':
+        modules.append('google.generativeai')
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"Background import of {name} failed: {e}")
+
+def create_app():
+    """Start the background services and return the app.
+
+    Importing this module only defines the app; nothing connects or starts
+    threads beyond the in-process queues. Run under gunicorn as
+    `gunicorn 'app:create_app()'` so each worker starts connecting to
+    storage at boot, while already answering /health. Safe to call more
+    than once.
+    """
+    global _services_started
+    with _services_lock:
+        if _services_started:
+            return app
+        if STORAGE_ENABLED:
+            storage.start()
+            if storage.name == 'sqlite':
+                # A local file opens in milliseconds; be ready before the first request
+                storage.wait(STORAGE_WAIT_TIMEOUT)
+        upload_janitor.start()
+        if WARM_IMPORTS:
+            threading.Thread(target=_warm_imports, name='warm-imports', daemon=True).start()
+        _services_started = True
+    return app
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,139 @@
+"""Model-route latency under a request spike, with and without admission control.
+
+For each configuration a fresh interpreter serves the app on a threaded
+local server with the stub model (fixed latency per call) and SQLite
+storage. `--clients` threads post uncached cloud prompts for `--duration`
+seconds, each as a different user, while a probe thread calls /health.
+With admission off, every request waits for a model slot for as long as
+it takes. With it on, excess requests get a fast 429 and admitted ones
+keep a bounded latency. Run from the backend directory:
+
+    python -m benchmarks.bench_admission --clients 64 --duration 10 --model-latency-ms 200
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+CONFIGS = {
+    'off': {'ADMISSION_MAX_CONCURRENT': '100000', 'ADMISSION_USER_REQUESTS_PER_MINUTE': '0'},
+    'on': {},
+}
+
+
+def run_child(clients, duration):
+    from werkzeug.serving import make_server
+
+    import app as backend
+
+    server = make_server('127.0.0.1', 0, backend.create_app(), threaded=True)
+    port = server.server_port
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    stop = time.monotonic() + duration
+    ok_latencies = []
+    rejected_latencies = []
+    statuses = {}
+    probe_latencies = []
+    lock = threading.Lock()
+
+    def prompt_loop(client_id):
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        n = 0
+        while time.monotonic() < stop:
+            n += 1
+            body = json.dumps({'prompt': f'spike {client_id} {n}', 'useCloud': True, 'userId': f'user-{client_id}'})
+            start = time.perf_counter()
+            conn.request('POST', '/api/hybrid/prompt', body=body, headers={'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+                (ok_latencies if response.status == 200 else rejected_latencies).append(elapsed)
+            if response.status == 429:
+                # A well-behaved client backs off instead of retrying in a hot loop
+                time.sleep(0.1)
+
+    def probe_loop():
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            conn.request('GET', '/health')
+            conn.getresponse().read()
+            probe_latencies.append(time.perf_counter() - start)
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=prompt_loop, args=(i,)) for i in range(clients)]
+    threads.append(threading.Thread(target=probe_loop))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    server.shutdown()
+
+    def pct(values, q):
+        return round(statistics.quantiles(values, n=100)[q - 1] * 1000, 1) if len(values) > 1 else None
+
+    print(json.dumps({
+        'ok_per_s': round(len(ok_latencies) / duration, 2),
+        'ok_p50_ms': pct(ok_latencies, 50),
+        'ok_p99_ms': pct(ok_latencies, 99),
+        'rejected_p50_ms': pct(rejected_latencies, 50),
+        'health_p50_ms': pct(probe_latencies, 50),
+        'health_p99_ms': pct(probe_latencies, 99),
+        'statuses': statuses,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--model-latency-ms', type=float, default=200)
+    parser.add_argument('--configs', nargs='+', choices=sorted(CONFIGS), default=['off', 'on'])
+    parser.add_argument('--json', action='store_true', help='emit machine-readable results')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.clients, args.duration)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.configs:
+            env = dict(
+                os.environ,
+                GEMINI_BACKEND='stub',
+                STUB_MODEL_LATENCY_MS=str(args.model_latency_ms),
+                STORAGE_BACKEND='sqlite',
+                STORAGE_SQLITE_PATH=os.path.join(tmp, f'bench-{name}.sqlite3'),
+                ACCESS_LOG_SAMPLE_RATE='0',
+                ACCESS_LOG_SLOW_MS='1e9',
+                **CONFIGS[name],
+            )
+            out = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_admission', '--child',
+                 '--clients', str(args.clients), '--duration', str(args.duration)],
+                env=env, capture_output=True, text=True, check=True,
+            )
+            results.append({'admission': name, **json.loads(out.stdout.strip().splitlines()[-1])})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'admission':>9} {'ok/s':>8} {'ok p50':>8} {'ok p99':>8} {'429 p50':>8} {'health p50':>11} {'health p99':>11}  statuses")
+    for r in results:
+        print(f"{r['admission']:>9} {r['ok_per_s']:>8} {r['ok_p50_ms']!s:>8} {r['ok_p99_ms']!s:>8} {r['rejected_p50_ms']!s:>8} "
+              f"{r['health_p50_ms']!s:>11} {r['health_p99_ms']!s:>11}  {r['statuses']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Compare python-docx and streaming DOCX text extraction: time and peak memory.
+
+Each extraction runs in a fresh interpreter so peak RSS (which also counts
+lxml's C allocations, invisible to tracemalloc) is measured in isolation.
+The python-docx baseline reads doc.paragraphs only; the streaming
+extractor also returns table rows, so its output is somewhat longer on
+fixtures with tables. Run from the backend directory:
+
+    python -m benchmarks.bench_docx_extraction --paragraphs 1000 5000 20000 --table-rows 500
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fixtures import make_docx
+
+
+def python_docx_extract(path):
+    """The original python-docx extraction, kept as the baseline"""
+    from docx import Document
+
+    doc = Document(path)
+    return "\n".join(p.text.strip() for p in doc.paragraphs if p.text.strip())
+
+
+def streaming_extract(path):
+    from docx_extraction import iter_docx_blocks
+
+    return "\n".join(iter_docx_blocks(path))
+
+
+EXTRACTORS = {'python-docx': python_docx_extract, 'streaming': streaming_extract}
+
+
+def _max_rss_kb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def run_child(method, path, repeat):
+    fn = EXTRACTORS[method]
+    # Import the extractor's dependencies before taking the memory baseline
+    import docx  # noqa: F401
+    import docx_extraction  # noqa: F401
+
+    before = _max_rss_kb()
+    samples = []
+    text = ''
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = fn(path)
+        samples.append(time.perf_counter() - start)
+    print(json.dumps({
+        'seconds': statistics.median(samples),
+        'peak_rss_mb': round((_max_rss_kb() - before) / 1024, 1),
+        'chars': len(text),
+    }))
+
+
+def measure(method, path, repeat):
+    out = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_docx_extraction', '--child', method, path, '--repeat', str(repeat)],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--paragraphs', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--table-rows', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help='emit machine-readable results')
+    parser.add_argument('--child', nargs=2, metavar=('METHOD', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.child[1], args.repeat)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for paragraphs in args.paragraphs:
+            path = os.path.join(tmp, f'fixture_{paragraphs}.docx')
+            with open(path, 'wb') as fh:
+                fh.write(make_docx(paragraphs, table_rows=args.table_rows))
+            baseline = measure('python-docx', path, args.repeat)
+            streaming = measure('streaming', path, args.repeat)
+            results.append({
+                'paragraphs': paragraphs,
+                'table_rows': args.table_rows,
+                'file_mb': round(os.path.getsize(path) / 1024 / 1024, 2),
+                'python_docx_s': round(baseline['seconds'], 4),
+                'streaming_s': round(streaming['seconds'], 4),
+                'speedup': round(baseline['seconds'] / streaming['seconds'], 2) if streaming['seconds'] else None,
+                'python_docx_peak_mb': baseline['peak_rss_mb'],
+                'streaming_peak_mb': streaming['peak_rss_mb'],
+                'python_docx_chars': baseline['chars'],
+                'streaming_chars': streaming['chars'],
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'paragraphs':>10} {'file MB':>8} {'python-docx s':>14} {'streaming s':>12} {'speedup':>8} "
+          f"{'python-docx MB':>15} {'streaming MB':>13}")
+    for r in results:
+        print(f"{r['paragraphs']:>10} {r['file_mb']:>8} {r['python_docx_s']:>14.3f} {r['streaming_s']:>12.3f} "
+              f"{r['speedup']:>7.2f}x {r['python_docx_peak_mb']:>15} {r['streaming_peak_mb']:>13}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Peak memory per multimodal request: base64 JSON vs multipart vs raw body.
+
+Each upload mode runs in a fresh interpreter (ru_maxrss is a process-wide
+high-water mark) against the app with the stub model backend. Reports the
+RSS growth caused by one request and the peak Python heap seen by
+tracemalloc. Run from the backend directory:
+
+    python -m benchmarks.bench_image_upload --width 3840 --height 2160
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+MODES = ('json-base64', 'multipart', 'octet-stream')
+
+
+def _rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_child(mode, width, height):
+    os.environ['GEMINI_BACKEND'] = 'stub'
+    import base64
+    import io
+
+    import app as backend
+    from benchmarks.fixtures import make_screenshot
+
+    client = backend.create_app().test_client()
+    url = '/api/multimodal/analyze-image'
+    png = make_screenshot(width, height)
+
+    # Warm up imports and code paths with a tiny image
+    small = make_screenshot(64, 64, seed=1)
+    client.post(url, data=small, content_type='image/png')
+
+    if mode == 'json-base64':
+        body = json.dumps({'image': 'data:image/png;base64,' + base64.b64encode(png).decode(), 'query': 'describe'}).encode()
+        send = lambda: client.post(url, data=body, content_type='application/json')
+    elif mode == 'multipart':
+        send = lambda: client.post(url, data={'image': (io.BytesIO(png), 'shot.png'), 'query': 'describe'},
+                                   content_type='multipart/form-data')
+    else:
+        send = lambda: client.post(f'{url}?query=describe', data=png, content_type='application/octet-stream')
+
+    rss_before = _rss_kb()
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = send()
+    elapsed = time.perf_counter() - start
+    _, heap_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert response.status_code == 200, response.get_data(as_text=True)
+
+    print(json.dumps({
+        'mode': mode,
+        'image_bytes': len(png),
+        'rss_growth_kb': _rss_kb() - rss_before,
+        'python_heap_peak_kb': heap_peak // 1024,
+        'latency_s': round(elapsed, 4),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--width', type=int, default=3840)
+    parser.add_argument('--height', type=int, default=2160)
+    parser.add_argument('--json', action='store_true', help='emit machine-readable results')
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.width, args.height)
+        return
+
+    results = []
+    for mode in MODES:
+        out = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_image_upload', '--child', mode,
+             '--width', str(args.width), '--height', str(args.height)],
+            capture_output=True, text=True, check=True,
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':<14} {'image KB':>9} {'RSS growth KB':>14} {'py heap peak KB':>16} {'latency s':>10}")
+    for r in results:
+        print(f"{r['mode']:<14} {r['image_bytes'] // 1024:>9} {r['rss_growth_kb']:>14} "
+              f"{r['python_heap_peak_kb']:>16} {r['latency_s']:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
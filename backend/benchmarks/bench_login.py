@@ -0,0 +1,137 @@
+"""Login throughput and side-effects on other endpoints under concurrent load.
+
+For each password-hash pool size, a fresh interpreter starts the app on a
+threaded local server backed by the SQLite storage, registers one user
+and then runs `--clients` threads that log in continuously for
+`--duration` seconds. A probe thread calls /health at the same time to
+show how much the login burst delays unrelated requests. Setting the pool
+size to the client count approximates the old behaviour, where every
+request thread hashed concurrently. Run from the backend directory:
+
+    python -m benchmarks.bench_login --clients 16 --duration 10 --workers 1 2 4 16
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+def _post(conn, path, body):
+    conn.request('POST', path, body=json.dumps(body), headers={'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def run_child(clients, duration):
+    from werkzeug.serving import make_server
+
+    import app as backend
+
+    server = make_server('127.0.0.1', 0, backend.create_app(), threaded=True)
+    port = server.server_port
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    credentials = {'email': 'bench@example.com', 'password': 'correct horse battery staple'}
+    assert _post(http.client.HTTPConnection('127.0.0.1', port), '/api/auth/register', credentials) == 201
+
+    stop = time.monotonic() + duration
+    login_latencies = []
+    statuses = {}
+    probe_latencies = []
+    lock = threading.Lock()
+
+    def login_loop():
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            status = _post(conn, '/api/auth/login', credentials)
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    login_latencies.append(elapsed)
+
+    def probe_loop():
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            conn.request('GET', '/health')
+            conn.getresponse().read()
+            probe_latencies.append(time.perf_counter() - start)
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=login_loop) for _ in range(clients)]
+    threads.append(threading.Thread(target=probe_loop))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    server.shutdown()
+
+    def pct(values, q):
+        return round(statistics.quantiles(values, n=100)[q - 1] * 1000, 1) if len(values) > 1 else None
+
+    print(json.dumps({
+        'workers': backend.password_hasher.workers,
+        'logins_per_s': round(len(login_latencies) / duration, 2),
+        'login_p50_ms': pct(login_latencies, 50),
+        'login_p95_ms': pct(login_latencies, 95),
+        'health_p50_ms': pct(probe_latencies, 50),
+        'health_p95_ms': pct(probe_latencies, 95),
+        'statuses': statuses,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 16])
+    parser.add_argument('--method', default='scrypt', help='PASSWORD_HASH_METHOD (work factor)')
+    parser.add_argument('--json', action='store_true', help='emit machine-readable results')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.clients, args.duration)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in args.workers:
+            env = dict(
+                os.environ,
+                GEMINI_BACKEND='stub',
+                STORAGE_BACKEND='sqlite',
+                STORAGE_SQLITE_PATH=os.path.join(tmp, f'bench-{workers}.sqlite3'),
+                PASSWORD_HASH_METHOD=args.method,
+                PASSWORD_HASH_WORKERS=str(workers),
+                PASSWORD_HASH_QUEUE_TIMEOUT='60',
+                AUTH_ATTEMPTS_PER_EMAIL='1000000',
+                AUTH_ATTEMPTS_PER_IP='1000000',
+            )
+            out = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_login', '--child',
+                 '--clients', str(args.clients), '--duration', str(args.duration)],
+                env=env, capture_output=True, text=True, check=True,
+            )
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'workers':>7} {'logins/s':>9} {'login p50':>10} {'login p95':>10} {'health p50':>11} {'health p95':>11}")
+    for r in results:
+        print(f"{r['workers']:>7} {r['logins_per_s']:>9} {r['login_p50_ms']!s:>10} {r['login_p95_ms']!s:>10} "
+              f"{r['health_p50_ms']!s:>11} {r['health_p95_ms']!s:>11}")
+
+
+if __name__ == '__main__':
+    main()
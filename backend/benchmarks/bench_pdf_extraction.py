@@ -0,0 +1,79 @@
+"""Compare serial and process-pool PDF text extraction.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_pdf_extraction --pages 100 300 600 --workers 4
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import PyPDF2
+
+from benchmarks.fixtures import write_pdf
+from pdf_extraction import PdfExtractor
+
+
+def serial_extract(path):
+    """The original request-thread loop, kept as the baseline"""
+    text_parts = []
+    with open(path, 'rb') as fh:
+        reader = PyPDF2.PdfReader(fh)
+        for p in reader.pages:
+            try:
+                text_parts.append(p.extract_text() or "")
+            except Exception:
+                continue
+    return "\n".join(text_parts)
+
+
+def timed(fn, path, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(path)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, nargs='+', default=[100, 300, 600])
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help='emit machine-readable results')
+    args = parser.parse_args()
+
+    extractor = PdfExtractor(workers=args.workers, page_timeout=30, min_pages=1)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # Warm the pool so worker start-up isn't billed to the first fixture
+        extractor.extract(write_pdf(os.path.join(tmp, 'warmup.pdf'), 4))
+        for pages in args.pages:
+            path = write_pdf(os.path.join(tmp, f'fixture_{pages}.pdf'), pages)
+            serial_s, serial_text = timed(serial_extract, path, args.repeat)
+            parallel_s, parallel_text = timed(extractor.extract, path, args.repeat)
+            results.append({
+                'pages': pages,
+                'workers': args.workers,
+                'serial_s': round(serial_s, 4),
+                'parallel_s': round(parallel_s, 4),
+                'speedup': round(serial_s / parallel_s, 2) if parallel_s else None,
+                'identical_output': serial_text == parallel_text,
+            })
+    extractor.shutdown()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'pages':>6} {'serial s':>10} {'parallel s':>11} {'speedup':>8}  identical")
+    for r in results:
+        print(f"{r['pages']:>6} {r['serial_s']:>10.3f} {r['parallel_s']:>11.3f} {r['speedup']:>7.2f}x  {r['identical_output']}")
+
+
+if __name__ == '__main__':
+    main()
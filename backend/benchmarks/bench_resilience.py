@@ -0,0 +1,151 @@
+"""Model-call resilience against a fault-injecting stub: retries, circuit breaker, hedging.
+
+Each (scenario, policy) pair runs in a fresh interpreter with the stub
+model and SQLite storage, driving the app through the test client one
+request at a time:
+
+- flaky: 20% of model calls fail with a 503. Uncached /api/hybrid/prompt
+  calls; reports the share answered by the model.
+- tail: 3% of model calls take 1s instead of 20ms. Reports p50/p99, which
+  hedging should pull in.
+- outage: every model call hangs past GEMINI_TIMEOUT. /process-document
+  summaries fall back to a truncated preview; reports how long each
+  fallback took. With the breaker on, only the first few wait.
+- probe: the upstream fails until the breaker opens, then recovers. The
+  client abandons the half-open probe (a streamed prompt) after its first
+  chunk, and the remaining requests must still be answered; a probe that
+  is never settled would leave the breaker refusing every call.
+
+Policies: baseline (one attempt, no breaker), retry, retry+breaker and
+retry+breaker+hedge. Run from the backend directory:
+
+    python -m benchmarks.bench_resilience --requests 200
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCENARIOS = {
+    'flaky': {'STUB_MODEL_LATENCY_MS': '20', 'STUB_MODEL_ERROR_RATE': '0.2'},
+    'tail': {'STUB_MODEL_LATENCY_MS': '20', 'STUB_MODEL_SLOW_RATE': '0.03', 'STUB_MODEL_SLOW_MS': '1000'},
+    'outage': {'STUB_MODEL_SLOW_RATE': '1', 'STUB_MODEL_SLOW_MS': '5000', 'GEMINI_TIMEOUT': '0.5'},
+    'probe': {'STUB_MODEL_LATENCY_MS': '20', 'GEMINI_BREAKER_RESET': '0.2'},
+}
+POLICIES = {
+    'baseline': {'GEMINI_MAX_ATTEMPTS': '1', 'GEMINI_BREAKER_FAILURES': '0', 'GEMINI_HEDGE': '0'},
+    'retry': {'GEMINI_MAX_ATTEMPTS': '3', 'GEMINI_BREAKER_FAILURES': '0', 'GEMINI_HEDGE': '0'},
+    'breaker': {'GEMINI_MAX_ATTEMPTS': '3', 'GEMINI_BREAKER_FAILURES': '5', 'GEMINI_HEDGE': '0'},
+    'hedge': {'GEMINI_MAX_ATTEMPTS': '3', 'GEMINI_BREAKER_FAILURES': '5', 'GEMINI_HEDGE': '1'},
+}
+
+
+def run_child(scenario, requests):
+    import app as backend
+    from benchmarks.fixtures import make_pdf
+
+    client = backend.create_app().test_client()
+    latencies = []
+    answered = 0
+
+    if scenario == 'outage':
+        response = client.post('/upload', data={'file': (io.BytesIO(make_pdf(1)), 'doc.pdf')}, content_type='multipart/form-data')
+        filename = response.json['filename']
+        for n in range(requests):
+            start = time.perf_counter()
+            response = client.post('/process-document', json={'filename': filename, 'action': 'summarize'})
+            latencies.append(time.perf_counter() - start)
+            answered += response.json.get('summary', '').startswith('[stub')
+            response.close()
+    elif scenario == 'probe':
+        model = backend.model_registry.get()
+        model.error_rate = 1.0
+        for n in range(10):
+            client.post('/api/hybrid/prompt', json={'prompt': f'failing {n}', 'useCloud': True}).close()
+        model.error_rate = 0.0
+        time.sleep(0.25)
+        response = client.post('/api/hybrid/prompt', json={'prompt': 'abandoned probe', 'useCloud': True, 'stream': True})
+        next(response.response)
+        response.close()
+        for n in range(requests):
+            start = time.perf_counter()
+            response = client.post('/api/hybrid/prompt', json={'prompt': f'after probe {n}', 'useCloud': True})
+            latencies.append(time.perf_counter() - start)
+            answered += response.status_code == 200
+            response.close()
+    else:
+        for n in range(requests):
+            start = time.perf_counter()
+            response = client.post('/api/hybrid/prompt', json={'prompt': f'resilience {n}', 'useCloud': True})
+            latencies.append(time.perf_counter() - start)
+            answered += response.status_code == 200
+            response.close()
+
+    def pct(q):
+        return round(statistics.quantiles(latencies, n=100)[q - 1] * 1000, 1)
+
+    stats = backend.model_registry.stats()
+    print(json.dumps({
+        'answered_pct': round(100 * answered / requests, 1),
+        'p50_ms': pct(50),
+        'p99_ms': pct(99),
+        'total_s': round(sum(latencies), 2),
+        'attempts': stats['attempts'],
+        'hedges': stats['hedges'],
+        'short_circuited': stats['short_circuited'],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--policies', nargs='+', choices=sorted(POLICIES), default=list(POLICIES))
+    parser.add_argument('--json', action='store_true', help='emit machine-readable results')
+    parser.add_argument('--child', choices=sorted(SCENARIOS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.requests)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for scenario in args.scenarios:
+            for policy in args.policies:
+                env = dict(
+                    os.environ,
+                    GEMINI_BACKEND='stub',
+                    STUB_MODEL_SEED='7',
+                    STORAGE_BACKEND='sqlite',
+                    STORAGE_SQLITE_PATH=os.path.join(tmp, f'{scenario}-{policy}.sqlite3'),
+                    EXTRACTION_CACHE_DIR=os.path.join(tmp, f'extracted-{scenario}-{policy}'),
+                    ADMISSION_USER_REQUESTS_PER_MINUTE='0',
+                    ACCESS_LOG_SAMPLE_RATE='0',
+                    ACCESS_LOG_SLOW_MS='1e9',
+                    **SCENARIOS[scenario],
+                    **POLICIES[policy],
+                )
+                out = subprocess.run(
+                    [sys.executable, '-m', 'benchmarks.bench_resilience', '--child', scenario,
+                     '--requests', str(args.requests)],
+                    env=env, capture_output=True, text=True, check=True,
+                )
+                results.append({'scenario': scenario, 'policy': policy, **json.loads(out.stdout.strip().splitlines()[-1])})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'scenario':>8} {'policy':>8} {'answered%':>9} {'p50 ms':>8} {'p99 ms':>8} {'total s':>8} {'attempts':>8} {'hedges':>6} {'fast-fail':>9}")
+    for r in results:
+        print(f"{r['scenario']:>8} {r['policy']:>8} {r['answered_pct']:>9} {r['p50_ms']:>8} {r['p99_ms']:>8} {r['total_s']:>8} "
+              f"{r['attempts']:>8} {r['hedges']:>6} {r['short_circuited']:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""End-to-end latency and throughput for the main backend routes.
+
+Starts the Flask app in-process with the stub model backend (fixed
+latency, no network) and the embedded SQLite storage in a temporary
+directory. Generates PDF, DOCX and screenshot fixtures of several sizes
+and drives each scenario with `--concurrency` client threads through the
+Flask test client. Per scenario it reports throughput and latency
+percentiles. Results can be saved as JSON and compared with a run from
+another commit. Run from the backend directory:
+
+    python -m benchmarks.bench_routes --output before.json
+    python -m benchmarks.bench_routes --compare before.json
+    python -m benchmarks.bench_routes --scenarios upload hybrid --requests 100 --concurrency 8
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from benchmarks.fixtures import lorem, make_docx, make_pdf, make_screenshot
+
+POOL_SIZE = 8
+WARMUP_REQUESTS = 4
+
+
+def configure_environment(tmp, model_latency_ms):
+    os.environ.update(
+        GEMINI_BACKEND='stub',
+        STUB_MODEL_LATENCY_MS=str(model_latency_ms),
+        STORAGE_BACKEND='sqlite',
+        STORAGE_SQLITE_PATH=os.path.join(tmp, 'storage.sqlite3'),
+        EXTRACTION_CACHE_DIR=os.path.join(tmp, 'extracted'),
+        AUTH_ATTEMPTS_PER_EMAIL='1000000',
+        AUTH_ATTEMPTS_PER_IP='1000000',
+        ADMISSION_USER_REQUESTS_PER_MINUTE='0',
+        ACCESS_LOG_SAMPLE_RATE='0',
+        ACCESS_LOG_SLOW_MS='1e9',
+    )
+
+
+def git_revision():
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True).stdout.strip()
+        return rev + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_scenarios(client, cold_count=64):
+    """Return {name: request(i) -> (method, url, kwargs)}; does any uploads the scenarios depend on"""
+    rng = random.Random(0)
+    pdf_small = [make_pdf(5, seed=s) for s in range(POOL_SIZE)]
+    pdf_large = [make_pdf(100, seed=s) for s in range(POOL_SIZE)]
+    docx_small = [make_docx(50, seed=s) for s in range(POOL_SIZE)]
+    docx_large = [make_docx(1500, table_rows=100, seed=s) for s in range(POOL_SIZE)]
+    shots_720p = [make_screenshot(1280, 720, seed=s) for s in range(POOL_SIZE)]
+    shots_4k = [make_screenshot(3840, 2160, seed=s) for s in range(2)]
+    long_text = lorem(1500, rng)
+
+    def upload(payloads, name):
+        return lambda i: ('POST', '/upload', {
+            'data': {'file': (io.BytesIO(payloads[i % len(payloads)]), name)},
+            'content_type': 'multipart/form-data',
+        })
+
+    def stored(payload, name):
+        response = client.post('/upload', data={'file': (io.BytesIO(payload), name)}, content_type='multipart/form-data')
+        assert response.status_code == 200, response.get_data(as_text=True)
+        return response.json['filename']
+
+    # Distinct documents for uncached summaries, plus one that is processed repeatedly.
+    # Each cold document is used once, warm-up included, so no timed request hits the cache.
+    cold_docs = [stored(make_pdf(3, seed=1000 + s), 'cold.pdf') for s in range(cold_count)]
+    next_cold = itertools.count()
+    warm_doc = stored(pdf_small[0], 'warm.pdf')
+    client.post('/process-document', json={'filename': warm_doc, 'action': 'summarize'})
+
+    # Sessions so stats and insights have data
+    events = [{'type': 'session', 'userId': 'bench-user', 'documentType': 'pdf',
+               'featuresUsed': ['summarize', 'tts'], 'duration': 30} for _ in range(200)]
+    client.post('/api/events/batch', json=events)
+
+    def image(payloads, url):
+        return lambda i: ('POST', url, {'data': payloads[i % len(payloads)], 'content_type': 'image/png'})
+
+    batch = [{'type': 'session', 'userId': f'user-{n % 10}', 'featuresUsed': ['simplify'], 'duration': 5} for n in range(50)]
+
+    def unique(i):
+        # Leading, so the cloud token cap (which cuts from the end) never removes it
+        return f"[{i}-{time.perf_counter_ns()}] {long_text}"
+
+    return {
+        'health': lambda i: ('GET', '/health', {}),
+        'upload_pdf_5p': upload(pdf_small, 'doc.pdf'),
+        'upload_pdf_100p': upload(pdf_large, 'doc.pdf'),
+        'upload_docx_50para': upload(docx_small, 'doc.docx'),
+        'upload_docx_1500para': upload(docx_large, 'doc.docx'),
+        'process_document_cold': lambda i: ('POST', '/process-document', {
+            'json': {'filename': cold_docs[next(next_cold) % len(cold_docs)], 'action': 'summarize'}}),
+        'process_document_cached': lambda i: ('POST', '/process-document', {
+            'json': {'filename': warm_doc, 'action': 'summarize'}}),
+        'hybrid_prompt_cold': lambda i: ('POST', '/api/hybrid/prompt', {
+            'json': {'prompt': unique(i), 'useCloud': True}}),
+        'hybrid_prompt_cached': lambda i: ('POST', '/api/hybrid/prompt', {
+            'json': {'prompt': long_text, 'useCloud': True}}),
+        'hybrid_prompt_stream': lambda i: ('POST', '/api/hybrid/prompt', {
+            'json': {'prompt': unique(i), 'useCloud': True, 'stream': True}}),
+        'hybrid_simplify_cold': lambda i: ('POST', '/api/hybrid/simplify', {
+            'json': {'text': unique(i), 'useCloud': True, 'accessibilityMode': 'dyslexia'}}),
+        'multimodal_analyze_720p': image(shots_720p, '/api/multimodal/analyze-image?query=describe'),
+        'multimodal_analyze_4k': image(shots_4k, '/api/multimodal/analyze-image?query=describe'),
+        'multimodal_ocr_720p': image(shots_720p, '/api/multimodal/ocr-translate?targetLanguage=French'),
+        'analytics_session': lambda i: ('POST', '/api/analytics/session', {
+            'json': {'userId': f'user-{i % 10}', 'documentType': 'web', 'featuresUsed': ['tts'], 'duration': 12}}),
+        'analytics_events_batch_50': lambda i: ('POST', '/api/events/batch', {'json': batch}),
+        'analytics_stats': lambda i: ('GET', '/api/analytics/stats/bench-user', {}),
+        'analytics_insights': lambda i: ('GET', '/api/analytics/insights/bench-user', {}),
+    }
+
+
+def run_scenario(app, make_request, total, concurrency):
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+    lock = threading.Lock()
+
+    def worker():
+        nonlocal errors
+        client = app.test_client()
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            method, url, kwargs = make_request(i)
+            start = time.perf_counter()
+            response = client.open(url, method=method, **kwargs)
+            response.get_data()
+            response.close()
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code >= 400:
+                    errors += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    wall = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall
+
+    cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / wall, 2),
+        'p50_ms': round(cuts[49] * 1000, 2),
+        'p90_ms': round(cuts[89] * 1000, 2),
+        'p99_ms': round(cuts[98] * 1000, 2),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+    }
+
+
+def print_table(results, baseline=None):
+    base = {r['scenario']: r for r in (baseline or {}).get('results', [])}
+    header = f"{'scenario':<28} {'req/s':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'errors':>7}"
+    if base:
+        header += f" {'p50 vs base':>12} {'req/s vs base':>14}"
+    print(header)
+    for r in results:
+        line = (f"{r['scenario']:<28} {r['throughput_rps']:>9} {r['p50_ms']:>9} {r['p90_ms']:>9} "
+                f"{r['p99_ms']:>9} {r['errors']:>7}")
+        old = base.get(r['scenario'])
+        if old:
+            p50 = (r['p50_ms'] / old['p50_ms'] - 1) * 100 if old['p50_ms'] else 0
+            rps = (r['throughput_rps'] / old['throughput_rps'] - 1) * 100 if old['throughput_rps'] else 0
+            line += f" {p50:>+11.1f}% {rps:>+13.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=40, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--model-latency-ms', type=float, default=50, help='stub model latency per call')
+    parser.add_argument('--scenarios', nargs='+', help='only run scenarios whose name contains one of these')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results from an earlier run to compare against')
+    parser.add_argument('--json', action='store_true', help='emit machine-readable results')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(tmp, args.model_latency_ms)
+        import app as backend
+        backend.create_app()
+
+        upload_folder = os.path.join(tmp, 'uploads')
+        os.makedirs(upload_folder)
+        backend.app.config['UPLOAD_FOLDER'] = upload_folder
+
+        client = backend.app.test_client()
+        # Enough cold documents for the warm-up plus every timed request
+        scenarios = build_scenarios(client, cold_count=args.requests + WARMUP_REQUESTS)
+        # Let the upload cache-warming threads finish before timing anything
+        time.sleep(1)
+
+        results = []
+        for name, make_request in scenarios.items():
+            if args.scenarios and not any(s in name for s in args.scenarios):
+                continue
+            run_scenario(backend.app, make_request, min(WARMUP_REQUESTS, args.requests), 1)  # warm-up
+            results.append({'scenario': name, **run_scenario(backend.app, make_request, args.requests, args.concurrency)})
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'config': {'requests': args.requests, 'concurrency': args.concurrency,
+                   'model_latency_ms': args.model_latency_ms},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(report, fh, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"revision {report['revision']}  concurrency {args.concurrency}  "
+          f"{args.requests} requests/scenario  model latency {args.model_latency_ms:g} ms", file=sys.stderr)
+    print_table(results, baseline)
+
+
+if __name__ == '__main__':
+    main()
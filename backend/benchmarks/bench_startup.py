@@ -0,0 +1,120 @@
+"""Cold-start cost: process spawn to importable app, to readiness, and first requests.
+
+Each run starts a fresh interpreter with the stub model and SQLite
+storage, and records:
+
+- spawn_to_import_s: from process spawn until `import app` returns
+- import_s: the `import app` statement alone
+- create_app_s: create_app() (starts storage connection and background services)
+- first_health_ms / ready_ms: first /health response, and time until /health/ready is 200
+- first_pdf_ms / first_image_ms: first PDF extraction and first image analysis,
+  the routes whose dependencies (PyPDF2, Pillow) are imported lazily
+- heavy modules already loaded right after the import
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --runs 5 --no-warm-imports
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HEAVY_MODULES = ('google.generativeai', 'PyPDF2', 'PIL', 'pymongo', 'docx')
+
+
+def run_child():
+    import_start = time.perf_counter()
+    import app as backend
+    import_s = time.perf_counter() - import_start
+    spawn_to_import_s = time.time() - float(os.environ['BENCH_SPAWN_TS'])
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    from benchmarks.fixtures import make_pdf, make_screenshot
+
+    start = time.perf_counter()
+    flask_app = backend.create_app()
+    create_app_s = time.perf_counter() - start
+    client = flask_app.test_client()
+
+    start = time.perf_counter()
+    client.get('/health')
+    first_health_ms = (time.perf_counter() - start) * 1000
+    while client.get('/health/ready').status_code != 200:
+        time.sleep(0.005)
+    ready_ms = (time.perf_counter() - start) * 1000
+
+    response = client.post('/upload', data={'file': (io.BytesIO(make_pdf(3)), 'doc.pdf')}, content_type='multipart/form-data')
+    filename = response.json['filename']
+    start = time.perf_counter()
+    client.post('/process-document', json={'filename': filename, 'action': 'summarize'})
+    first_pdf_ms = (time.perf_counter() - start) * 1000
+
+    image = make_screenshot(1280, 720)
+    start = time.perf_counter()
+    client.post('/api/multimodal/analyze-image?query=describe', data=image, content_type='image/png')
+    first_image_ms = (time.perf_counter() - start) * 1000
+
+    print(json.dumps({
+        'spawn_to_import_s': round(spawn_to_import_s, 3),
+        'import_s': round(import_s, 3),
+        'create_app_s': round(create_app_s, 3),
+        'first_health_ms': round(first_health_ms, 1),
+        'ready_ms': round(ready_ms, 1),
+        'first_pdf_ms': round(first_pdf_ms, 1),
+        'first_image_ms': round(first_image_ms, 1),
+        'loaded_at_import': loaded,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--no-warm-imports', action='store_true', help='set WARM_IMPORTS=0')
+    parser.add_argument('--json', action='store_true', help='emit machine-readable results')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child()
+        return
+
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in range(args.runs):
+            env = dict(
+                os.environ,
+                GEMINI_BACKEND='stub',
+                STORAGE_BACKEND='sqlite',
+                STORAGE_SQLITE_PATH=os.path.join(tmp, f'startup-{n}.sqlite3'),
+                EXTRACTION_CACHE_DIR=os.path.join(tmp, f'extracted-{n}'),
+                ACCESS_LOG_SAMPLE_RATE='0',
+                WARM_IMPORTS='0' if args.no_warm_imports else '1',
+                BENCH_SPAWN_TS=repr(time.time()),
+            )
+            out = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_startup', '--child'],
+                env=env, capture_output=True, text=True, check=True,
+            )
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    metrics = [key for key in runs[0] if key != 'loaded_at_import']
+    summary = {key: statistics.median(run[key] for run in runs) for key in metrics}
+    summary['loaded_at_import'] = runs[0]['loaded_at_import']
+
+    if args.json:
+        print(json.dumps({'runs': runs, 'median': summary}, indent=2))
+        return
+    for key in metrics:
+        print(f"{key:<20} {summary[key]:>10}")
+    print(f"{'loaded_at_import':<20} {', '.join(summary['loaded_at_import']) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
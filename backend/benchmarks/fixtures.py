@@ -0,0 +1,98 @@
+"""Synthetic document fixtures for the backend benchmarks."""
+import random
+
+WORDS = (
+    "accessibility learning reader summary document student focus attention "
+    "language model cloud device page chapter section paragraph sentence note "
+    "example figure result method analysis support research context detail"
+).split()
+
+
+def lorem(n_words, rng):
+    return " ".join(rng.choice(WORDS) for _ in range(n_words))
+
+
+def _pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def make_pdf(page_count, lines_per_page=40, words_per_line=12, seed=0):
+    """Return the bytes of a text-only PDF with the given number of pages"""
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in below
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for _ in range(page_count):
+        lines = [_pdf_escape(lorem(words_per_line, rng)) for _ in range(lines_per_page)]
+        stream = ("BT /F1 10 Tf 40 760 Td 14 TL " + " ".join(f"({line}) '" for line in lines) + " ET").encode('latin-1')
+        page_id = len(objects) + 1
+        kids.append(f"{page_id} 0 R")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {page_count} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def write_pdf(path, page_count, **kwargs):
+    with open(path, 'wb') as fh:
+        fh.write(make_pdf(page_count, **kwargs))
+    return path
+
+
+def make_screenshot(width=3840, height=2160, seed=0, fmt='PNG'):
+    """Return encoded bytes of a synthetic screenshot: coloured panels, a photo-like region and text"""
+    import io
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.new('RGB', (width, height), (245, 245, 245))
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        colour = tuple(rng.randrange(256) for _ in range(3))
+        draw.rectangle((x, y, x + rng.randrange(100, 800), y + rng.randrange(50, 400)), fill=colour)
+    photo = Image.effect_noise((width // 3, height // 3), 40).convert('RGB')
+    image.paste(photo, (width // 2, height // 4))
+    for line in range(height // 18):
+        draw.text((rng.randrange(40, 200), line * 18), lorem(rng.randrange(5, 25), rng), fill=(20, 20, 20))
+    out = io.BytesIO()
+    image.save(out, format=fmt)
+    return out.getvalue()
+
+
+def make_docx(paragraph_count, words_per_paragraph=60, table_rows=0, seed=0):
+    """Return the bytes of a Word document with the given number of paragraphs (and optionally a table)"""
+    import io
+    from docx import Document
+
+    rng = random.Random(seed)
+    document = Document()
+    for i in range(paragraph_count):
+        if i % 20 == 0:
+            document.add_heading(lorem(6, rng), level=2)
+        document.add_paragraph(lorem(words_per_paragraph, rng))
+    if table_rows:
+        table = document.add_table(rows=table_rows, cols=3)
+        for row in table.rows:
+            for cell in row.cells:
+                cell.text = lorem(8, rng)
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
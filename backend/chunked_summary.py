@@ -0,0 +1,95 @@
+"""Map-reduce summarization for documents longer than one model prompt.
+
+The text is split on paragraph/page boundaries into chunks of at most
+`max_chars`. Chunk boundaries are content-defined: besides the size limit, a
+chunk also closes after an "anchor" paragraph (chosen by hashing the
+paragraph), so inserting or editing text only changes the chunks around the
+edit. Combined with the response cache, re-summarizing an edited document
+only sends the changed chunks to the model.
+"""
+import hashlib
+import re
+
+ANCHOR_MODULUS = 8
+
+
+def _is_anchor(paragraph):
+    digest = hashlib.blake2b(paragraph.encode('utf-8'), digest_size=4).digest()
+    return int.from_bytes(digest, 'big') % ANCHOR_MODULUS == 0
+
+
+def _split_oversized(piece, max_chars):
+    """Split a single paragraph longer than max_chars on sentence, then word, boundaries"""
+    parts = []
+    current = ''
+    for sentence in re.split(r'(?<=[.!?])\s+', piece):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(' ', 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            head, sentence = sentence[:cut], sentence[cut:].lstrip()
+            if current:
+                parts.append(current)
+                current = ''
+            parts.append(head)
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            parts.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        parts.append(current)
+    return parts
+
+
+def split_into_chunks(text, max_chars, min_chars=None):
+    """Split text into chunks of at most max_chars on paragraph/page boundaries"""
+    if min_chars is None:
+        min_chars = max_chars // 2
+    paragraphs = []
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        if len(line) > max_chars:
+            paragraphs.extend(_split_oversized(line, max_chars))
+        else:
+            paragraphs.append(line)
+
+    chunks = []
+    current = []
+    size = 0
+    for paragraph in paragraphs:
+        if current and size + len(paragraph) + 1 > max_chars:
+            chunks.append('\n'.join(current))
+            current, size = [], 0
+        current.append(paragraph)
+        size += len(paragraph) + 1
+        if size >= min_chars and _is_anchor(paragraph):
+            chunks.append('\n'.join(current))
+            current, size = [], 0
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
+
+
+def map_reduce_summarize(text, summarize_chunk, combine, executor, max_chars):
+    """Summarize each chunk concurrently, then combine the partial summaries.
+
+    `summarize_chunk(chunk)` and `combine(joined_summaries)` each make one model
+    call. If the partial summaries are themselves too long for one prompt they
+    are reduced again in chunks.
+    """
+    chunks = split_into_chunks(text, max_chars)
+    if len(chunks) == 1:
+        return summarize_chunk(chunks[0])
+    summaries = list(executor.map(summarize_chunk, chunks))
+    while True:
+        joined = '\n\n'.join(s.strip() for s in summaries if s)
+        if len(joined) <= max_chars:
+            return combine(joined)
+        groups = split_into_chunks(joined, max_chars)
+        if len(groups) >= len(summaries):
+            # Partial summaries are not shrinking; combine what fits
+            return combine(joined[:max_chars])
+        summaries = list(executor.map(combine, groups))
@@ -0,0 +1,98 @@
+"""Streaming text extraction from Word (.docx) files.
+
+python-docx builds an lxml tree of the whole document and wraps every
+paragraph in an object before any text can be read, and doc.paragraphs
+leaves out tables. iter_docx_blocks instead reads the main document part
+straight from the zip archive with an incremental parser. It yields each
+paragraph's text as soon as the paragraph closes and discards the parsed
+elements, so memory stays flat however long the document is.
+
+Table rows are yielded as one block with the cells separated by tabs.
+Nested tables are folded into the cell that contains them.
+"""
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_MC_FALLBACK = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+_RELS = '{http://schemas.openxmlformats.org/package/2006/relationships}Relationship'
+_OFFICE_DOCUMENT = '/officeDocument'
+
+_P, _T, _TAB, _BR, _CR = _W + 'p', _W + 't', _W + 'tab', _W + 'br', _W + 'cr'
+_TBL, _TR, _TC = _W + 'tbl', _W + 'tr', _W + 'tc'
+
+
+def _main_part(archive):
+    """Name of the main document part, from the package relationships"""
+    try:
+        with archive.open('_rels/.rels') as fh:
+            for rel in ET.parse(fh).getroot().iter(_RELS):
+                if rel.get('Type', '').endswith(_OFFICE_DOCUMENT):
+                    return posixpath.normpath(rel.get('Target').lstrip('/'))
+    except KeyError:
+        pass
+    return 'word/document.xml'
+
+
+def iter_docx_blocks(path):
+    """Yield the non-empty paragraphs and table rows of a .docx file, in document order"""
+    with zipfile.ZipFile(path) as archive, archive.open(_main_part(archive)) as fh:
+        paragraphs = []      # text parts of the open paragraphs (text boxes nest inside paragraphs)
+        cells = []           # finished cells of the current outermost table row
+        cell = []            # paragraph texts of the current outermost cell
+        table_depth = 0
+        fallback_depth = 0   # inside mc:Fallback, which repeats the mc:Choice content
+        depth = 0
+        body = None
+        for event, elem in ET.iterparse(fh, events=('start', 'end')):
+            tag = elem.tag
+            if event == 'start':
+                depth += 1
+                if depth == 2:
+                    body = elem
+                elif tag == _MC_FALLBACK:
+                    fallback_depth += 1
+                elif fallback_depth:
+                    pass
+                elif tag == _P:
+                    paragraphs.append([])
+                elif tag == _TBL:
+                    table_depth += 1
+                continue
+
+            depth -= 1
+            if tag == _MC_FALLBACK:
+                fallback_depth -= 1
+            elif fallback_depth:
+                pass
+            elif tag == _T:
+                if paragraphs and elem.text:
+                    paragraphs[-1].append(elem.text)
+            elif tag == _TAB:
+                if paragraphs:
+                    paragraphs[-1].append('\t')
+            elif tag == _BR or tag == _CR:
+                if paragraphs:
+                    paragraphs[-1].append('\n')
+            elif tag == _P:
+                text = ''.join(paragraphs.pop()).strip()
+                elem.clear()
+                if text:
+                    if table_depth:
+                        cell.append(text)
+                    else:
+                        yield text
+            elif tag == _TC and table_depth == 1:
+                cells.append(' '.join(cell))
+                cell = []
+            elif tag == _TR and table_depth == 1:
+                if any(cells):
+                    yield '\t'.join(cells)
+                cells = []
+            elif tag == _TBL:
+                table_depth -= 1
+
+            # Drop finished top-level blocks so the tree never holds more than one
+            if depth == 2 and body is not None:
+                body.clear()
@@ -0,0 +1,102 @@
+"""Content-addressed on-disk cache for text extracted from uploaded documents.
+
+Entries are keyed on the SHA-256 of the file bytes, so the same document
+uploaded twice (or by two different users) is parsed only once. The cache
+directory is bounded in size and evicts least-recently-used entries, using
+file mtimes as the recency clock so several worker processes can share it.
+"""
+import hashlib
+import os
+import threading
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's contents"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ExtractionCache:
+    """Size-bounded LRU cache of extracted text stored as files on disk"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # (path, size, mtime) -> digest, so unchanged files are not re-hashed
+        self._digests = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def digest(self, path):
+        """Return the content digest for a file, memoized on its size and mtime"""
+        st = os.stat(path)
+        memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        digest = self._digests.get(memo_key)
+        if digest is None:
+            digest = file_digest(path)
+            with self._lock:
+                if len(self._digests) > 4096:
+                    self._digests.clear()
+                self._digests[memo_key] = digest
+        return digest
+
+    def _entry_path(self, digest):
+        return os.path.join(self.directory, digest[:2], f"{digest}.txt")
+
+    def get(self, digest):
+        """Return cached text for a digest, or None on a miss"""
+        entry = self._entry_path(digest)
+        try:
+            with open(entry, 'r', encoding='utf-8') as fh:
+                text = fh.read()
+        except (FileNotFoundError, UnicodeDecodeError):
+            return None
+        try:
+            os.utime(entry, None)  # bump recency for LRU eviction
+        except OSError:
+            pass
+        return text
+
+    def has(self, digest):
+        """True if text is cached for a digest (without reading it or bumping its recency)"""
+        return os.path.exists(self._entry_path(digest))
+
+    def put(self, digest, text):
+        """Store extracted text for a digest and evict old entries if over budget"""
+        entry = self._entry_path(digest)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            fh.write(text)
+        os.replace(tmp, entry)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for root, _dirs, files in os.walk(self.directory):
+                for name in files:
+                    if not name.endswith('.txt'):
+                        continue
+                    full = os.path.join(root, name)
+                    try:
+                        st = os.stat(full)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, full))
+                    total += st.st_size
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            for _mtime, size, full in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(full)
+                    total -= size
+                except OSError:
+                    continue
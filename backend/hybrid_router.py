@@ -0,0 +1,228 @@
+"""Routing between Chrome's on-device model and the cloud model.
+
+The hybrid endpoints used to send text to the cloud above a fixed
+character count and cut it at 10,000 characters, mid-word. HybridRouter
+makes the decision from:
+
+- an estimate of the input's token count (estimate_tokens),
+- rolling latency and success measurements per target and mode: cloud
+  calls are recorded by the server, on-device runs are reported by the
+  client,
+- the on-device context limit and a latency budget.
+
+On-device is free, so it wins whenever it fits its context and its
+expected latency is within the budget. Otherwise the faster target wins.
+A failed on-device run falls back to the cloud, so the on-device estimate
+includes the cost of that fallback at the observed failure rate.
+
+Text sent to the cloud is cut to a token budget on a sentence boundary
+(truncate_to_tokens). Every decision is returned with the inputs it was
+based on, so clients and logs can see why a target was chosen.
+"""
+import math
+import re
+import threading
+from collections import deque
+
+CLOUD = 'cloud'
+ON_DEVICE = 'on-device'
+
+# English averages about 4 characters per token; most non-ASCII scripts are closer to one per character
+CHARS_PER_TOKEN = 4
+
+TRUNCATION_NOTE = "\n\n[Content truncated to fit API limit.]"
+
+# Where a sentence (or a line) ends; the cut is made right after the match
+_SENTENCE_END = re.compile(r'[.!?…]["\')\]]*\s|[。！？]|\n')
+
+
+def estimate_tokens(text):
+    """Approximate token count of text, without a tokenizer"""
+    if not text:
+        return 0
+    if text.isascii():
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return math.ceil((len(text) - non_ascii) / CHARS_PER_TOKEN) + non_ascii
+
+
+def _prefix_within(text, max_tokens):
+    """Longest prefix length whose estimate is at most max_tokens"""
+    if text.isascii():
+        return min(len(text), max_tokens * CHARS_PER_TOKEN)
+    low, high = 0, min(len(text), max_tokens * CHARS_PER_TOKEN)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def truncate_to_tokens(text, max_tokens, note=TRUNCATION_NOTE, min_keep=0.8):
+    """Return (text, truncated) with text cut to about max_tokens.
+
+    The cut is moved back to the last sentence end, or failing that the last
+    whitespace, as long as at least `min_keep` of the allowed prefix is kept.
+    """
+    if not max_tokens or estimate_tokens(text) <= max_tokens:
+        return text, False
+    cut = _prefix_within(text, max_tokens)
+    floor = int(cut * min_keep)
+    boundary = None
+    for match in _SENTENCE_END.finditer(text, floor, cut):
+        boundary = match.end()
+    if boundary is None:
+        space = max(text.rfind(' ', floor, cut), text.rfind('\n', floor, cut))
+        boundary = space if space > 0 else cut
+    return text[:boundary].rstrip() + note, True
+
+
+class RollingLatency:
+    """Last `window` (tokens, seconds, ok) samples for one target and mode"""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, tokens, seconds, ok=True):
+        with self._lock:
+            self._samples.append((tokens, seconds, ok))
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._samples)
+
+
+def _fit(samples):
+    """Least-squares (base seconds, seconds per token) over successful samples, or None"""
+    points = [(tokens, seconds) for tokens, seconds, ok in samples if ok]
+    if not points:
+        return None
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if var_x == 0:
+        return mean_y, 0.0
+    slope = max(0.0, sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x)
+    return max(0.0, mean_y - slope * mean_x), slope
+
+
+class HybridRouter:
+    """Chooses cloud or on-device per request from token estimates and measured latencies"""
+
+    # (base seconds, seconds per token) used until a target has min_samples measurements
+    DEFAULT_PRIORS = {
+        CLOUD: (1.5, 0.0005),
+        ON_DEVICE: (0.5, 0.002),
+    }
+
+    def __init__(self, on_device_max_tokens, cloud_max_tokens=None, latency_budget=3.0,
+                 min_on_device_success=0.8, window=200, min_samples=5, priors=None):
+        self.on_device_max_tokens = dict(on_device_max_tokens)
+        self.cloud_max_tokens = dict(cloud_max_tokens or {})
+        self.latency_budget = latency_budget
+        self.min_on_device_success = min_on_device_success
+        self.window = window
+        self.min_samples = min_samples
+        self.priors = dict(self.DEFAULT_PRIORS, **(priors or {}))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _rolling(self, target, mode):
+        with self._lock:
+            series = self._series.get((target, mode))
+            if series is None:
+                series = self._series[(target, mode)] = RollingLatency(self.window)
+            return series
+
+    def record(self, target, mode, tokens, seconds, ok=True):
+        """Add a measured call: cloud calls from the server, on-device runs from client telemetry"""
+        self._rolling(target, mode).record(tokens, seconds, ok)
+
+    def estimate(self, target, mode, tokens):
+        """Return {'seconds', 'success_rate', 'samples', 'measured'} for running `tokens` on target"""
+        samples = self._rolling(target, mode).snapshot()
+        fitted = _fit(samples) if len(samples) >= self.min_samples else None
+        base, per_token = fitted or self.priors[target]
+        ok = sum(1 for _, _, success in samples if success)
+        return {
+            'seconds': base + per_token * tokens,
+            'success_rate': ok / len(samples) if len(samples) >= self.min_samples else 1.0,
+            'samples': len(samples),
+            'measured': fitted is not None,
+        }
+
+    def route(self, mode, text, force_cloud=False, cloud_available=True, on_device_available=True):
+        """Decide where `text` runs; returns the decision dict (see routing info in the API responses)"""
+        tokens = estimate_tokens(text)
+        cloud = self.estimate(CLOUD, mode, tokens)
+        device = self.estimate(ON_DEVICE, mode, tokens)
+        # A failed on-device run is retried in the cloud
+        device_expected = device['seconds'] + (1 - device['success_rate']) * cloud['seconds']
+        on_device_limit = self.on_device_max_tokens.get(mode)
+
+        if force_cloud:
+            target, reason = CLOUD, 'requested'
+        elif on_device_limit and tokens > on_device_limit:
+            target, reason = CLOUD, 'exceeds_on_device_context'
+        elif not cloud_available:
+            target, reason = ON_DEVICE, 'cloud_unavailable'
+        elif not on_device_available:
+            target, reason = CLOUD, 'on_device_unavailable'
+        elif device['success_rate'] < self.min_on_device_success:
+            target, reason = CLOUD, 'on_device_unreliable'
+        elif device_expected <= self.latency_budget:
+            target, reason = ON_DEVICE, 'on_device_within_budget'
+        elif cloud['seconds'] < device_expected:
+            target, reason = CLOUD, 'cloud_faster'
+        else:
+            target, reason = ON_DEVICE, 'on_device_faster'
+
+        return {
+            'target': target,
+            'reason': reason,
+            'mode': mode,
+            'estimated_tokens': tokens,
+            'on_device_max_tokens': on_device_limit,
+            'latency_budget_ms': round(self.latency_budget * 1000),
+            'estimates': {
+                CLOUD: {
+                    'latency_ms': round(cloud['seconds'] * 1000),
+                    'success_rate': round(cloud['success_rate'], 3),
+                    'samples': cloud['samples'],
+                    'measured': cloud['measured'],
+                },
+                ON_DEVICE: {
+                    'latency_ms': round(device['seconds'] * 1000),
+                    'expected_with_fallback_ms': round(device_expected * 1000),
+                    'success_rate': round(device['success_rate'], 3),
+                    'samples': device['samples'],
+                    'measured': device['measured'],
+                },
+            },
+        }
+
+    def prepare_cloud_text(self, mode, text, decision):
+        """Cut text to the cloud token budget for mode, noting it in the decision"""
+        text, truncated = truncate_to_tokens(text, self.cloud_max_tokens.get(mode))
+        decision['truncated'] = truncated
+        if truncated:
+            decision['sent_tokens'] = estimate_tokens(text)
+        return text
+
+    def stats(self):
+        with self._lock:
+            keys = sorted(self._series)
+        stats = {}
+        for target, mode in keys:
+            samples = self._series[(target, mode)].snapshot()
+            ok = [seconds for _, seconds, success in samples if success]
+            stats[f"{mode}:{target}"] = {
+                'samples': len(samples),
+                'success_rate': round(len(ok) / len(samples), 3) if samples else None,
+                'mean_latency_ms': round(sum(ok) / len(ok) * 1000) if ok else None,
+            }
+        return stats
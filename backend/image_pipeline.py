@@ -0,0 +1,169 @@
+"""Image preprocessing for multimodal model calls.
+
+Screenshots arrive at full resolution (often 4K). Before they are sent to
+the model they are downscaled to a per-task size cap, re-encoded in a
+compact format and stripped of metadata:
+
+- 'analysis': longest side capped at 1024px, JPEG. Scene understanding
+  does not need more.
+- 'ocr': longest side capped at 2048px, lossless WebP, so small text stays
+  sharp.
+
+The encoded image is passed to the SDK as an inline blob so it is not
+re-encoded again. Each prepared image also carries a cache token for the
+response cache: an exact hash of the downscaled pixels, so a re-submitted
+screenshot hits the cache even when its metadata or container changed, but
+two screenshots that differ only in a few words never share a result.
+
+Analysis can opt in to near-duplicate matching with a PerceptualIndex: a
+coarse difference hash within a few bits of one seen recently reuses that
+hash's cache entry. Pages of text with the same layout collide easily
+under such a hash, so matches are only made within one scope (user) and
+the option is off by default.
+
+Pillow is imported on first use so that app start-up does not pay for it.
+"""
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+TASK_SETTINGS = {
+    'analysis': {'max_side': 1024, 'format': 'JPEG', 'mime_type': 'image/jpeg', 'save': {'quality': 85, 'optimize': True}},
+    'ocr': {'max_side': 2048, 'format': 'WEBP', 'mime_type': 'image/webp', 'save': {'lossless': True, 'method': 4}},
+}
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an uploaded image exceeds the configured size limit"""
+
+
+def read_limited(stream, max_bytes, chunk_size=64 * 1024):
+    """Copy a (possibly non-seekable) request stream into a buffer, failing as soon as it exceeds max_bytes"""
+    buffer = io.BytesIO()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        if buffer.tell() + len(chunk) > max_bytes:
+            raise ImageTooLargeError(f"Image larger than {max_bytes} bytes")
+        buffer.write(chunk)
+    buffer.seek(0)
+    return buffer
+
+
+@dataclass
+class PreparedImage:
+    part: dict
+    width: int
+    height: int
+    original_bytes: int
+    sent_bytes: int
+    cache_token: str
+
+    @property
+    def bytes_saved(self):
+        return max(0, self.original_bytes - self.sent_bytes)
+
+    def report(self):
+        return {
+            'width': self.width,
+            'height': self.height,
+            'original_bytes': self.original_bytes,
+            'sent_bytes': self.sent_bytes,
+            'bytes_saved': self.bytes_saved,
+        }
+
+
+def difference_hash(image, hash_size=16, margin=4):
+    """Perceptual dHash: compares neighbouring pixels of a small grayscale thumbnail.
+
+    A pixel only counts as brighter than its neighbour by more than `margin`
+    grey levels, so compression noise in flat areas doesn't flip bits.
+    """
+    from PIL import Image
+
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.BOX)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1] + margin)
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+class PerceptualIndex:
+    """Maps a perceptual hash to a recently seen hash within `max_distance` bits of it in the same scope"""
+
+    def __init__(self, max_distance=4, capacity=1024):
+        self.max_distance = max_distance
+        self.capacity = capacity
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+
+    def canonical(self, hex_hash, scope=''):
+        value = int(hex_hash, 16)
+        with self._lock:
+            if self.max_distance > 0 and (scope, hex_hash) not in self._recent:
+                for (seen_scope, seen), seen_value in self._recent.items():
+                    if seen_scope == scope and (value ^ seen_value).bit_count() <= self.max_distance:
+                        hex_hash = seen
+                        break
+            key = (scope, hex_hash)
+            self._recent[key] = int(hex_hash, 16)
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.capacity:
+                self._recent.popitem(last=False)
+        return hex_hash
+
+
+def _flatten(image):
+    """Convert to RGB, compositing any transparency onto white"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        from PIL import Image
+
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def prepare_image(source, task, perceptual_index=None, scope=''):
+    """Downscale, re-encode and fingerprint an image (bytes or a seekable binary stream) for the given task.
+
+    With a perceptual_index, analysis images are fingerprinted by near-duplicate
+    matching within `scope` instead of by exact pixels.
+    """
+    from PIL import Image, ImageOps
+
+    settings = TASK_SETTINGS[task]
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    original_bytes = source.seek(0, io.SEEK_END)
+    source.seek(0)
+    image = Image.open(source)
+    image = ImageOps.exif_transpose(image)
+    image = _flatten(image)
+    image.thumbnail((settings['max_side'], settings['max_side']), Image.LANCZOS)
+
+    out = io.BytesIO()
+    # Saving without exif/icc/info drops the original metadata
+    image.save(out, format=settings['format'], **settings['save'])
+    encoded = out.getvalue()
+
+    if task == 'analysis' and perceptual_index is not None and perceptual_index.max_distance > 0:
+        token = f"dhash:{scope}:{perceptual_index.canonical(difference_hash(image), scope)}"
+    else:
+        token = 'px:' + hashlib.sha256(image.tobytes()).hexdigest()
+
+    return PreparedImage(
+        part={'mime_type': settings['mime_type'], 'data': encoded},
+        width=image.width,
+        height=image.height,
+        original_bytes=original_bytes,
+        sent_bytes=len(encoded),
+        cache_token=token,
+    )
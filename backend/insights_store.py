@@ -0,0 +1,69 @@
+"""Stored per-user AI insights with a session watermark.
+
+Insights are saved alongside the number of sessions the user had when they
+were generated (the watermark, taken from the user's session rollup). A
+stored insight is served as-is until at least `min_new_sessions` more
+sessions have been logged or it is older than `ttl` seconds. With
+background refresh enabled, a stale insight is still served immediately
+while a single refresh per user runs on a small worker pool.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class InsightsStore:
+    """Reads and writes generated insights and decides when they need regenerating"""
+
+    def __init__(self, min_new_sessions=5, ttl=24 * 3600, background_workers=0):
+        self.min_new_sessions = min_new_sessions
+        self.ttl = ttl
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = (
+            ThreadPoolExecutor(max_workers=background_workers, thread_name_prefix='insights')
+            if background_workers > 0 else None
+        )
+
+    @property
+    def background(self):
+        return self._executor is not None
+
+    def get(self, storage, user_id):
+        return storage.get_insights(user_id)
+
+    def save(self, storage, user_id, insights, session_count, watermark):
+        doc = {
+            'insights': insights,
+            'session_count': session_count,
+            'watermark': watermark,
+            'generated_at': time.time(),
+        }
+        storage.save_insights(user_id, doc)
+        return doc
+
+    def is_fresh(self, stored, watermark):
+        """True if stored insights can be served for a user who now has `watermark` sessions"""
+        if not stored:
+            return False
+        if watermark - stored.get('watermark', 0) >= self.min_new_sessions:
+            return False
+        return time.time() - stored.get('generated_at', 0) < self.ttl
+
+    def refresh_in_background(self, user_id, refresh):
+        """Run refresh() on the worker pool unless one is already running for this user"""
+        with self._lock:
+            if user_id in self._refreshing:
+                return False
+            self._refreshing.add(user_id)
+        self._executor.submit(self._run_refresh, user_id, refresh)
+        return True
+
+    def _run_refresh(self, user_id, refresh):
+        try:
+            refresh()
+        except Exception as e:
+            print(f"Background insights refresh failed for {user_id}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(user_id)
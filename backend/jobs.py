@@ -0,0 +1,203 @@
+"""Background jobs with pollable status and partial results.
+
+A JobQueue runs submitted work on a local thread pool and records each
+job's status and results in a JobStore. MemoryJobStore keeps jobs in
+process. SQLiteJobStore keeps them in a file, so any worker process on the
+host can answer status polls for a job another worker is running. Neither
+needs an external service.
+"""
+import json
+import math
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED = (DONE, FAILED)
+
+
+class JobQueueFull(Exception):
+    """Raised by submit() when max_pending jobs are already queued or running"""
+
+    def __init__(self, retry_after):
+        super().__init__("Too many document jobs in progress; try again shortly")
+        self.retry_after = retry_after
+
+
+class MemoryJobStore:
+    """Jobs kept in a dict; only visible to the process that created them"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job):
+        with self._lock:
+            self._jobs[job['id']] = dict(job, result=dict(job['result']))
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job, result=dict(job['result'])) if job else None
+
+    def update(self, job_id, result=None, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields, updated_at=time.time())
+            if result:
+                job['result'].update(result)
+
+    def purge(self, older_than):
+        """Delete finished jobs last updated before older_than; queued and running jobs are kept"""
+        with self._lock:
+            expired = [j for j, job in self._jobs.items() if job['status'] in FINISHED and job['updated_at'] < older_than]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+
+class SQLiteJobStore:
+    """Jobs kept in a SQLite file shared by all worker processes on the host"""
+
+    COLUMNS = ('id', 'kind', 'status', 'stage', 'params', 'result', 'error', 'created_at', 'updated_at')
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'id TEXT PRIMARY KEY, kind TEXT, status TEXT, stage TEXT, params TEXT, '
+            'result TEXT, error TEXT, created_at REAL, updated_at REAL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_updated_at ON jobs (updated_at)')
+        self._conn.commit()
+
+    def create(self, job):
+        row = dict(job, params=json.dumps(job['params']), result=json.dumps(job['result']))
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                [row[c] for c in self.COLUMNS],
+            )
+            self._conn.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(self.COLUMNS, row))
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result'])
+        return job
+
+    def update(self, job_id, result=None, **fields):
+        fields['updated_at'] = time.time()
+        with self._lock:
+            if result:
+                row = self._conn.execute('SELECT result FROM jobs WHERE id = ?', (job_id,)).fetchone()
+                if row is None:
+                    return
+                merged = json.loads(row[0])
+                merged.update(result)
+                fields['result'] = json.dumps(merged)
+            assignments = ', '.join(f"{name} = ?" for name in fields)
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", [*fields.values(), job_id])
+            self._conn.commit()
+
+    def purge(self, older_than):
+        """Delete finished jobs last updated before older_than; queued and running jobs are kept"""
+        with self._lock:
+            self._conn.execute(
+                f"DELETE FROM jobs WHERE updated_at < ? AND status IN ({', '.join('?' * len(FINISHED))})",
+                (older_than, *FINISHED),
+            )
+            self._conn.commit()
+
+
+class JobQueue:
+    """Runs submitted jobs on a bounded thread pool and tracks them in a store.
+
+    At most max_pending jobs are queued or running in this process; submit()
+    raises JobQueueFull beyond that instead of growing the executor's queue.
+    """
+
+    def __init__(self, store, workers=2, ttl=3600, max_pending=32):
+        self.store = store
+        self.ttl = ttl
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._avg_duration = 1.0
+
+    def stats(self):
+        with self._lock:
+            return {'pending': self._pending, 'max_pending': self.max_pending, 'avg_duration': round(self._avg_duration, 3)}
+
+    def _retry_after(self):
+        # Roughly the time for one round of the queue ahead to drain
+        return max(1, math.ceil(self._avg_duration * self._pending / self.workers))
+
+    def submit(self, kind, fn, params):
+        """Queue fn(job_id, **params) and return the new job id.
+
+        fn reports progress through update(); its return value (a dict) is
+        merged into the job's result when it finishes.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(self._retry_after())
+            self._pending += 1
+        try:
+            now = time.time()
+            self.store.purge(now - self.ttl)
+            job_id = uuid.uuid4().hex
+            self.store.create({
+                'id': job_id, 'kind': kind, 'status': QUEUED, 'stage': None,
+                'params': params, 'result': {}, 'error': None,
+                'created_at': now, 'updated_at': now,
+            })
+            self._executor.submit(self._run, job_id, fn, params)
+        except BaseException:
+            self._finished(None)
+            raise
+        return job_id
+
+    def _finished(self, duration):
+        with self._lock:
+            self._pending -= 1
+            if duration is not None:
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+
+    def _run(self, job_id, fn, params):
+        start = time.monotonic()
+        try:
+            self.store.update(job_id, status=RUNNING)
+            try:
+                result = fn(job_id, **params)
+            except Exception as e:
+                print(f"Job {job_id} failed: {e}")
+                self.store.update(job_id, status=FAILED, stage=None, error=str(e))
+                return
+            self.store.update(job_id, result=result or None, status=DONE, stage=None)
+        finally:
+            self._finished(time.monotonic() - start)
+
+    def update(self, job_id, stage=None, result=None):
+        """Record progress: the current stage and/or partial results"""
+        fields = {'stage': stage} if stage is not None else {}
+        self.store.update(job_id, result=result, **fields)
+
+    def get(self, job_id):
+        return self.store.get(job_id)
@@ -0,0 +1,114 @@
+"""Concurrency control for upstream model calls.
+
+ModelCallGate bounds how many model calls are in flight across the whole
+process and coalesces identical concurrent calls ("single flight"): when N
+requests with the same key arrive together, one of them calls the model and
+the others wait for and share its result.
+
+Calls are plain callables, so the gate works the same with the Gemini SDK or
+a local fake model, and from any number of request threads (the Flask dev
+server, or gunicorn's gthread workers).
+"""
+import threading
+
+
+class ModelBusyError(Exception):
+    """Raised when no model-call slot frees up within the queue timeout"""
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share its outcome"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Return (result, shared) where shared is True if another caller did the work"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+
+class ModelCallGate:
+    """Global in-flight limit plus single-flight coalescing for model calls"""
+
+    def __init__(self, max_inflight=16, queue_timeout=30.0):
+        self.max_inflight = max_inflight
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_inflight)
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self.inflight = 0
+        self.calls = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    def call(self, key, fn):
+        """Run fn() under the in-flight limit, sharing the result with identical concurrent calls"""
+        if key is None:
+            return self._limited(fn)
+        result, shared = self._flight.do(key, lambda: self._limited(fn))
+        if shared:
+            with self._lock:
+                self.coalesced += 1
+        return result
+
+    def acquire(self):
+        """Take an in-flight slot (for streaming calls), raising ModelBusyError on timeout"""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise ModelBusyError("Too many AI requests in progress. Please try again shortly.")
+        with self._lock:
+            self.inflight += 1
+            self.calls += 1
+
+    def release(self):
+        with self._lock:
+            self.inflight -= 1
+        self._slots.release()
+
+    def _limited(self, fn):
+        self.acquire()
+        try:
+            return fn()
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_inflight': self.max_inflight,
+                'inflight': self.inflight,
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'rejected': self.rejected,
+            }
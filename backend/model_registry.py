@@ -0,0 +1,296 @@
+"""Central registry for the generative models the backend calls.
+
+Model objects are created once and reused across requests instead of being
+constructed inside every handler. The registry also owns the model-name
+configuration, default generation settings and the call policy (deadline,
+retries, circuit breaker and hedging, see resilience.py), and can serve a
+local stub backend so the app runs (and can be load tested) without network
+access or an API key. The stub can inject failures and slow calls to
+exercise that policy.
+
+The Gemini SDK takes most of a second to import, so it is only imported
+(and configured) when the first real model is created.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from resilience import CallPolicy, CircuitBreaker, CircuitOpenError, ModelTimeoutError
+
+
+_END = object()
+
+
+class TransientModelError(Exception):
+    """A stub failure shaped like an upstream 503, which the call policy retries"""
+
+    retryable = True
+    code = 503
+
+
+class StubDeadlineExceeded(Exception):
+    """Raised by the stub when a call outlives its request_options timeout, like the SDK's DeadlineExceeded"""
+
+    retryable = True
+    code = 504
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubModel:
+    """Offline stand-in for genai.GenerativeModel with a configurable latency and fault rates"""
+
+    def __init__(self, model_name, latency=0.0, error_rate=0.0, slow_rate=0.0, slow_latency=0.0, seed=None):
+        self.model_name = f"models/{model_name}"
+        self.latency = latency
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def _fault(self):
+        """Latency for this call, raising TransientModelError for an injected failure"""
+        if not self.error_rate and not self.slow_rate:
+            return self.latency
+        with self._random_lock:
+            fail = self._random.random() < self.error_rate
+            slow = self._random.random() < self.slow_rate
+        if fail:
+            raise TransientModelError("503 stub model unavailable")
+        return self.slow_latency if slow else self.latency
+
+    def _describe(self, contents):
+        parts = contents if isinstance(contents, (list, tuple)) else [contents]
+        described = []
+        for part in parts:
+            if isinstance(part, str):
+                described.append(' '.join(part.split())[:200])
+            elif isinstance(part, dict) and 'mime_type' in part:
+                described.append(f"[{part['mime_type']} {len(part.get('data', b''))} bytes]")
+            elif hasattr(part, 'size'):
+                described.append(f"[image {part.size[0]}x{part.size[1]}]")
+            else:
+                described.append(f"[{type(part).__name__}]")
+        return ' '.join(described)
+
+    def generate_content(self, contents, stream=False, request_options=None, **kwargs):
+        text = f"[stub {self.model_name}] {self._describe(contents)}"
+        latency = self._fault()
+        timeout = (request_options or {}).get('timeout')
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        if stream:
+            return self._stream(text, latency, deadline)
+        self._sleep(latency, deadline)
+        return StubResponse(text)
+
+    @staticmethod
+    def _sleep(seconds, deadline):
+        """Sleep, giving up with StubDeadlineExceeded at the deadline as the SDK's own timeout would"""
+        if deadline is not None and time.monotonic() + seconds > deadline:
+            time.sleep(max(0.0, deadline - time.monotonic()))
+            raise StubDeadlineExceeded("504 stub deadline exceeded")
+        if seconds:
+            time.sleep(seconds)
+
+    def _stream(self, text, latency, deadline):
+        words = text.split(' ')
+        for i, word in enumerate(words):
+            self._sleep(latency / len(words), deadline)
+            yield StubResponse(word if i == 0 else f" {word}")
+
+
+class ModelRegistry:
+    """Creates each configured model once and runs calls under a deadline/retry/breaker policy"""
+
+    def __init__(self, backend='gemini', default_model='gemini-2.0-flash-lite', api_key=None,
+                 generation_config=None, request_timeout=None, stub_latency=0.0, max_workers=16,
+                 observer=None, max_attempts=1, attempt_timeout=None, breaker_failures=0,
+                 breaker_reset=30.0, hedge=False, stub_faults=None):
+        self.backend = backend
+        # observer(model_name, mode, seconds, outcome) is told about every finished call
+        self.observer = observer
+        self.default_model = default_model
+        self.generation_config = generation_config or None
+        self.request_timeout = request_timeout
+        self.stub_latency = stub_latency
+        # error_rate / slow_rate / slow_latency / seed for StubModel
+        self.stub_faults = stub_faults or {}
+        self.api_key = api_key
+        self._genai = None
+        self._models = {}
+        self._lock = threading.Lock()
+        # A hedged call can hold two workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers * (2 if hedge else 1), thread_name_prefix='model-call')
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset) if breaker_failures else None
+        self.policy = CallPolicy(
+            self._executor,
+            deadline=request_timeout,
+            attempt_timeout=attempt_timeout,
+            max_attempts=max_attempts,
+            breaker=self.breaker,
+            hedge=hedge,
+        )
+
+        if backend == 'stub':
+            self.enabled = True
+        elif api_key:
+            self.enabled = True
+        else:
+            self.enabled = False
+
+    def get(self, name=None):
+        """Return the shared model object for a model name (the default model if omitted)"""
+        name = name or self.default_model
+        model = self._models.get(name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(name)
+                if model is None:
+                    if self.backend == 'stub':
+                        model = StubModel(name, self.stub_latency, **self.stub_faults)
+                    else:
+                        model = self._sdk().GenerativeModel(name, generation_config=self.generation_config)
+                    self._models[name] = model
+        return model
+
+    def _sdk(self):
+        """The configured google.generativeai module, imported on first use (call with self._lock held)"""
+        if self._genai is None:
+            import google.generativeai as genai
+
+            genai.configure(api_key=self.api_key)
+            self._genai = genai
+        return self._genai
+
+    def _observe(self, model, mode, start, outcome):
+        if self.observer is not None:
+            self.observer(model.model_name, mode, time.perf_counter() - start, outcome)
+
+    def generate(self, model, contents, **kwargs):
+        """Call model.generate_content under the call policy.
+
+        Raises ModelTimeoutError past the deadline and CircuitOpenError, without calling
+        the model, while the circuit breaker is open.
+        """
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            base_options = kwargs.pop('request_options', None)
+            response = self.policy.call(
+                lambda timeout: model.generate_content(contents, request_options=self._request_options(base_options, timeout), **kwargs)
+            )
+            outcome = 'ok'
+            return response
+        except CircuitOpenError:
+            outcome = 'circuit_open'
+            raise
+        except ModelTimeoutError:
+            outcome = 'timeout'
+            raise
+        finally:
+            self._observe(model, 'generate', start, outcome)
+
+    @staticmethod
+    def _request_options(base_options, timeout):
+        """SDK request options for one attempt: its own timeout, and no SDK-level retries (the policy retries)"""
+        options = dict(base_options or {})
+        options['retry'] = None
+        if timeout is not None:
+            options['timeout'] = max(0.001, timeout)
+        return options
+
+    def _within(self, deadline, fn, *args):
+        """Run fn(*args) on the call executor, raising ModelTimeoutError if it is still running at deadline"""
+        if deadline is None:
+            return fn(*args)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise ModelTimeoutError(f"AI request timed out after {self.request_timeout:.3g}s")
+        future = self._executor.submit(fn, *args)
+        try:
+            return future.result(timeout=remaining)
+        except FutureTimeout:
+            # A chunk already being fetched cannot be interrupted; its result is dropped
+            future.cancel()
+            raise ModelTimeoutError(f"AI request timed out after {self.request_timeout:.3g}s")
+
+    def stream(self, model, contents, **kwargs):
+        """Yield response text incrementally as the model generates it.
+
+        The request timeout is a deadline for the whole stream: each chunk is pulled on
+        the call executor and ModelTimeoutError is raised once the deadline passes.
+        A failure before the first chunk is retried like generate(); once text has been
+        sent to the client the stream cannot be restarted, so later failures propagate.
+        """
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            self.policy.check()
+        except CircuitOpenError:
+            self._observe(model, 'stream', start, 'circuit_open')
+            raise
+        deadline = time.monotonic() + self.request_timeout if self.request_timeout else None
+        base_options = kwargs.pop('request_options', None)
+        attempt = 0
+        started = False
+        # True while an attempt's outcome has not been given to the breaker yet
+        unsettled = False
+        try:
+            while True:
+                attempt += 1
+                unsettled = True
+                try:
+                    timeout = deadline - time.monotonic() if deadline is not None else None
+                    request_options = self._request_options(base_options, timeout)
+                    chunks = iter(self._within(
+                        deadline, lambda: model.generate_content(contents, stream=True, request_options=request_options, **kwargs)
+                    ))
+                    while True:
+                        chunk = self._within(deadline, next, chunks, _END)
+                        if chunk is _END:
+                            break
+                        try:
+                            text = chunk.text
+                        except ValueError:
+                            # Chunks carrying only finish/safety metadata have no text
+                            continue
+                        if text:
+                            started = True
+                            yield text
+                except GeneratorExit:
+                    raise
+                except Exception as e:
+                    unsettled = False
+                    self.policy.record(e)
+                    delay = None if started else self.policy.backoff(attempt, e, deadline)
+                    if delay is None:
+                        raise
+                    time.sleep(delay)
+                    continue
+                unsettled = False
+                self.policy.record()
+                outcome = 'ok'
+                return
+        except GeneratorExit:
+            outcome = 'cancelled'
+            raise
+        except ModelTimeoutError:
+            outcome = 'timeout'
+            raise
+        finally:
+            if unsettled:
+                # The client went away mid-stream. That says nothing bad about the upstream,
+                # but if this stream was the breaker's half-open probe it must still settle it.
+                if started:
+                    self.policy.record()
+                else:
+                    self.policy.abandon()
+            self._observe(model, 'stream', start, outcome)
+
+    def stats(self):
+        return self.policy.stats()
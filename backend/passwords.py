@@ -0,0 +1,68 @@
+"""Password hashing off the request thread, with bounded concurrency.
+
+Password hashes are deliberately expensive (scrypt by default). Left on
+the request threads, a burst of logins can occupy every CPU and stall
+unrelated endpoints. PasswordHasher runs hashing on a small dedicated
+pool, and at most `workers` hashes run at once. A request that cannot get
+a slot within `queue_timeout` seconds fails with HasherBusyError instead
+of queueing without bound.
+
+hashlib's scrypt and pbkdf2 release the GIL, so the default thread pool
+runs hashes in parallel. executor='process' isolates them in worker
+processes instead.
+
+The work factor is part of `method`, in werkzeug's format: 'scrypt',
+'scrypt:16384:8:1', 'pbkdf2:sha256:600000'. Stored hashes record the
+method they were made with, so changing it only affects new passwords.
+"""
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusyError(Exception):
+    """Raised when no hashing slot frees up within the queue timeout"""
+
+
+class PasswordHasher:
+    """Bounded pool for generate_password_hash / check_password_hash"""
+
+    def __init__(self, method='scrypt', workers=2, queue_timeout=5.0, executor='thread'):
+        self.method = method
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(workers)
+        if executor == 'process':
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._lock = threading.Lock()
+        self.inflight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, hashed, password):
+        return self._run(check_password_hash, hashed, password)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusyError("Too many sign-in requests in progress. Please try again shortly.")
+        with self._lock:
+            self.inflight += 1
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self.inflight -= 1
+                self.completed += 1
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {'inflight': self.inflight, 'completed': self.completed, 'rejected': self.rejected}
@@ -0,0 +1,190 @@
+"""Page-sharded PDF text extraction over a bounded process pool.
+
+Small documents are extracted serially in the calling thread. Larger ones
+fan out one task per page to a ProcessPoolExecutor (so PyPDF2's pure-Python
+parsing runs on several cores instead of holding the request thread) and the
+page texts are reassembled in order. Each page gets its own timeout: a page
+that does not finish in time is left out of the result rather than stalling
+the whole document.
+
+With a character budget, pages are submitted in batches sized from the
+characters per page seen so far, and extraction stops once the budget is
+met, so a long document is not parsed past the part that is needed.
+
+PyPDF2 is imported on first use, so importing the app does not pay for it;
+the forkserver preloads it for the pool workers.
+"""
+import atexit
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+# Per worker process: the most recently opened document, so consecutive page
+# tasks for the same file don't re-parse its cross-reference table.
+_open_document = {}
+
+
+def _get_reader(path):
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    entry = _open_document.get(key)
+    if entry is None:
+        import PyPDF2
+
+        for fh, _reader in _open_document.values():
+            fh.close()
+        _open_document.clear()
+        fh = open(path, 'rb')
+        entry = (fh, PyPDF2.PdfReader(fh))
+        _open_document[key] = entry
+    return entry[1]
+
+
+def _extract_page(path, index):
+    """Worker task: return the text of one page, or None if it could not be read"""
+    try:
+        return _get_reader(path).pages[index].extract_text() or ""
+    except Exception:
+        return None
+
+
+def _pool_context():
+    # Forking a multi-threaded server is unsafe; a forkserver that preloads this
+    # module (and PyPDF2) makes each new worker cheap to start.
+    methods = multiprocessing.get_all_start_methods()
+    if 'forkserver' in methods:
+        ctx = multiprocessing.get_context('forkserver')
+        ctx.set_forkserver_preload([__name__, 'PyPDF2'])
+        return ctx
+    return multiprocessing.get_context('spawn')
+
+
+class PdfExtractor:
+    """Extracts PDF text, parallelizing across pages for large documents"""
+
+    def __init__(self, workers=None, page_timeout=10.0, min_pages=16):
+        self.workers = max(0, workers if workers is not None else min(4, os.cpu_count() or 1))
+        self.page_timeout = page_timeout
+        self.min_pages = min_pages
+        self._pool = None
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_pool_context())
+            return self._pool
+
+    def _retire_pool(self, pool):
+        # shutdown() alone leaves a worker that is stuck on a pathological page
+        # running (and burning CPU) until the page finishes, so the workers are
+        # terminated. Pages of other documents still in flight on the old pool
+        # fail with BrokenProcessPool and are left out of their results; new
+        # documents get a fresh pool.
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        processes = list((pool._processes or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def extract(self, path, max_chars=None):
+        """Return the text of every readable page (or of the pages filling max_chars), joined with newlines"""
+        return self.extract_text(path, max_chars)[0]
+
+    def extract_text(self, path, max_chars=None):
+        """Return (text, complete).
+
+        complete is False when pages were lost to timeouts, a broken pool or an error
+        part-way through the document, so the text may be missing parts that a retry
+        would find; callers should not cache it as the document's text.
+        """
+        import PyPDF2
+
+        with open(path, 'rb') as fh:
+            reader = PyPDF2.PdfReader(fh)
+            page_count = len(reader.pages)
+            if self.workers <= 1 or page_count < self.min_pages:
+                return self._extract_serial(reader, max_chars)
+        return self._extract_parallel(os.path.abspath(path), page_count, max_chars)
+
+    def _extract_serial(self, reader, max_chars):
+        text_parts = []
+        total = 0
+        try:
+            for p in reader.pages:
+                try:
+                    page_text = p.extract_text() or ""
+                except Exception:
+                    continue
+                text_parts.append(page_text)
+                total += len(page_text) + 1
+                if max_chars and total >= max_chars:
+                    break
+        except Exception:
+            # A broken page tree: keep the pages read so far
+            return "\n".join(text_parts), False
+        return "\n".join(text_parts), True
+
+    def _lookahead(self, page_count, max_chars, pages_read, chars_read):
+        """How many pages to keep submitted ahead of the page being read"""
+        if not max_chars:
+            return page_count
+        if not pages_read or not chars_read:
+            return self.workers * 2
+        # Enough pages to fill the rest of the budget at the density seen so far
+        per_page = chars_read / pages_read
+        return max(self.workers * 2, math.ceil((max_chars - chars_read) / per_page))
+
+    def _extract_parallel(self, path, page_count, max_chars):
+        pool = self._get_pool()
+        futures = {}
+        submitted = 0
+        text_parts = []
+        total = 0
+        complete = True
+        retire = False
+        timeouts = 0
+        for index in range(page_count):
+            lookahead = self._lookahead(page_count, max_chars, index, total)
+            try:
+                while submitted < page_count and submitted < index + lookahead:
+                    futures[submitted] = pool.submit(_extract_page, path, submitted)
+                    submitted += 1
+                page_text = futures.pop(index).result(timeout=self.page_timeout)
+            except FutureTimeout:
+                print(f"PDF page {index} of {os.path.basename(path)} timed out after {self.page_timeout}s")
+                retire = True
+                complete = False
+                timeouts += 1
+                if timeouts >= self.workers:
+                    # Every worker may be wedged; return what we have instead of waiting out each page
+                    break
+                continue
+            except BrokenProcessPool:
+                # A worker died; nothing more will come back from this pool
+                retire = True
+                complete = False
+                break
+            if page_text is not None:
+                text_parts.append(page_text)
+                total += len(page_text) + 1
+                if max_chars and total >= max_chars:
+                    break
+        for pending in futures.values():
+            pending.cancel()
+        if retire:
+            self._retire_pool(pool)
+        return "\n".join(text_parts), complete
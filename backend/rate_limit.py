@@ -0,0 +1,40 @@
+"""In-process token-bucket rate limiting.
+
+Each key (an email address, a client IP, ...) gets a bucket holding up to
+`burst` tokens, refilled at `rate` tokens per second. take() spends a
+token if one is available and otherwise reports how long until one will
+be. Buckets live in this process only, so with several workers the
+effective limit is per worker. The least recently used buckets are
+dropped beyond `max_keys` to bound memory.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets"""
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, cost=1):
+        """Spend `cost` tokens from key's bucket; returns 0 if allowed, else seconds until it would be"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
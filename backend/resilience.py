@@ -0,0 +1,270 @@
+"""Deadlines, retries, circuit breaking and hedging for upstream model calls.
+
+CallPolicy runs one logical model call as one or more attempts:
+
+- The whole call has a deadline. Each attempt gets whatever is left (or
+  `attempt_timeout`, if that is shorter). A call past its deadline raises
+  ModelTimeoutError instead of hanging on a slow upstream.
+- Retryable failures are retried with full-jitter exponential backoff,
+  up to `max_attempts` and never past the deadline. Retryable failures
+  are timeouts, rate limiting and 5xx-style unavailability. A rejected
+  prompt or invalid argument is not retried.
+- A CircuitBreaker counts consecutive retryable failures. Once it trips,
+  calls fail at once with CircuitOpenError (a ModelBusyError, so routes
+  answer 503 or use their non-AI fallback) until `reset_timeout` has
+  passed. A single probe call then decides whether to close it again.
+- With hedging on, an attempt that is still running after the recent p95
+  attempt latency gets a duplicate, and the first success wins. The
+  loser cannot be cancelled once it has started; its result is dropped.
+
+Each attempt is handed the seconds it has left, to pass on to the client
+library as its own timeout (with the library's retries off), so an
+abandoned attempt stops on its own and this is the only retry layer.
+
+Exceptions are classified by name and status code, so the Gemini SDK
+(google.api_core) does not have to be imported here.
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from model_gate import ModelBusyError
+
+# google.api_core.exceptions (and builtins) that indicate a transient upstream problem
+RETRYABLE_ERROR_NAMES = {
+    'TooManyRequests', 'ResourceExhausted', 'InternalServerError', 'ServiceUnavailable', 'BadGateway',
+    'GatewayTimeout', 'DeadlineExceeded', 'RetryError', 'ModelTimeoutError', 'ConnectionError',
+    'TimeoutError',
+}
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class ModelTimeoutError(Exception):
+    """Raised when a model call does not finish within its deadline"""
+
+
+class CircuitOpenError(ModelBusyError):
+    """Raised without calling the model while the circuit breaker is open"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_retryable(error):
+    if getattr(error, 'retryable', False):
+        return True
+    if any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    code = getattr(error, 'code', None)
+    return isinstance(code, int) and code in RETRYABLE_STATUS_CODES
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures; lets one probe through after `reset_timeout`"""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.trips = 0
+
+    def allow(self):
+        """True if a call may go to the upstream now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def retry_after(self):
+        with self._lock:
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def release_probe(self):
+        """Give up a half-open probe without an outcome, so the next call may probe instead"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self._failures >= self.failure_threshold):
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class CallPolicy:
+    """Runs model calls with a deadline, jittered retries, a circuit breaker and optional hedging"""
+
+    def __init__(self, executor, deadline=60.0, attempt_timeout=None, max_attempts=3, base_delay=0.25,
+                 max_delay=4.0, breaker=None, hedge=False, hedge_quantile=0.95, hedge_min_samples=20, window=200):
+        self.executor = executor
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.counts = {'calls': 0, 'attempts': 0, 'retries': 0, 'hedges': 0, 'hedge_wins': 0,
+                       'timeouts': 0, 'short_circuited': 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+    # Pieces shared by call() and streaming callers
+
+    def check(self):
+        """Raise CircuitOpenError if the breaker is not letting calls through"""
+        self._count('calls')
+        if self.breaker is not None and not self.breaker.allow():
+            self._count('short_circuited')
+            retry_after = self.breaker.retry_after()
+            raise CircuitOpenError(f"AI service temporarily unavailable. Retry in {retry_after:.0f}s.", retry_after)
+
+    def record(self, error=None):
+        """Feed an attempt's outcome to the breaker: only transient failures count against the upstream"""
+        if self.breaker is None:
+            return
+        if error is not None and is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def abandon(self):
+        """The call was dropped by the caller before it produced an outcome"""
+        if self.breaker is not None:
+            self.breaker.release_probe()
+
+    def backoff(self, attempt, error, deadline=None):
+        """Seconds to sleep before retrying after `error` on attempt number `attempt`, or None to give up"""
+        if attempt >= self.max_attempts or not is_retryable(error):
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        if self.breaker is not None and not self.breaker.allow():
+            return None
+        self._count('retries')
+        return delay
+
+    def hedge_delay(self):
+        """The recent `hedge_quantile` attempt latency, or None while there are too few samples"""
+        with self._lock:
+            if not self.hedge or len(self._latencies) < self.hedge_min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_quantile))]
+
+    # Request/response calls
+
+    def call(self, fn):
+        """Return fn(timeout)'s result, applying the policy.
+
+        fn makes one attempt; timeout is the seconds that attempt has left, or None.
+        """
+        self.check()
+        deadline = time.monotonic() + self.deadline if self.deadline else None
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = self._attempt(fn, deadline)
+            except Exception as e:
+                self.record(e)
+                delay = self.backoff(attempt, e, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self.record()
+            return result
+
+    def _attempt(self, fn, deadline):
+        self._count('attempts')
+        start = time.perf_counter()
+        if deadline is None and not self.hedge and not self.attempt_timeout:
+            result = fn(None)
+            self._observe(time.perf_counter() - start)
+            return result
+
+        timeout = deadline - time.monotonic() if deadline is not None else None
+        if self.attempt_timeout:
+            timeout = min(timeout, self.attempt_timeout) if timeout is not None else self.attempt_timeout
+        if timeout is not None and timeout <= 0:
+            self._count('timeouts')
+            raise ModelTimeoutError("AI request deadline exceeded")
+        end = time.monotonic() + timeout if timeout is not None else None
+
+        futures = [self.executor.submit(fn, timeout)]
+        hedge_after = self.hedge_delay()
+        if hedge_after is not None and (timeout is None or hedge_after < timeout):
+            done, _ = wait(futures, timeout=hedge_after)
+            if not done:
+                self._count('hedges')
+                futures.append(self.executor.submit(fn, end - time.monotonic() if end is not None else None))
+
+        error = None
+        pending = set(futures)
+        while pending:
+            remaining = end - time.monotonic() if end is not None else None
+            if remaining is not None and remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if future is not futures[0]:
+                        self._count('hedge_wins')
+                    self._observe(time.perf_counter() - start)
+                    return future.result()
+                error = error or future.exception()
+        if not pending and error is not None:
+            raise error
+        for future in pending:
+            future.cancel()
+        self._count('timeouts')
+        raise ModelTimeoutError(f"AI request timed out after {timeout:.3g}s")
+
+    def _observe(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+        hedge_delay = self.hedge_delay()
+        stats['hedge_delay_ms'] = round(hedge_delay * 1000, 1) if hedge_delay is not None else None
+        if self.breaker is not None:
+            stats['breaker'] = self.breaker.state
+            stats['breaker_trips'] = self.breaker.trips
+        return stats
@@ -0,0 +1,181 @@
+"""Tiered cache for Gemini text responses.
+
+Keys are a hash of the model name, the final prompt (after accessibility
+formatting, whitespace-normalized) and the accessibility mode. Lookups go
+through the tiers in order - an in-process LRU with TTL first, then an
+optional SQLite file shared by every worker on the host - and a hit in a
+slower tier is copied into the faster ones. The SQLite tier purges expired
+rows periodically and keeps at most `max_rows`, dropping the entries that
+expire soonest (the oldest writes) first.
+"""
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_prompt(prompt):
+    """Collapse insignificant whitespace so trivially different prompts share a key"""
+    prompt = prompt.replace('\r\n', '\n').strip()
+    prompt = re.sub(r'[ \t]+', ' ', prompt)
+    return re.sub(r'\n{3,}', '\n\n', prompt)
+
+
+def make_key(model_name, prompt, mode=None):
+    """Build the cache key for a model call"""
+    h = hashlib.sha256()
+    for part in (model_name or '', mode or '', normalize_prompt(prompt)):
+        h.update(part.encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+class MemoryTier:
+    """Thread-safe in-process LRU with per-entry TTL"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=1024, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.time() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteTier:
+    """Persistent, size-capped tier backed by a SQLite file, shared across worker processes"""
+
+    name = 'sqlite'
+
+    def __init__(self, path, ttl=86400, max_rows=50000, purge_interval=300, purge_every_writes=1000):
+        self.path = path
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.purge_interval = purge_interval
+        self.purge_every_writes = purge_every_writes
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._last_purge = time.monotonic()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)')
+        self._conn.commit()
+        with self._lock:
+            self._purge()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, expires_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._conn.commit()
+                return None
+            return row[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, value, time.time() + self.ttl),
+            )
+            self._conn.commit()
+            self._writes += 1
+            if self._writes >= self.purge_every_writes or time.monotonic() - self._last_purge >= self.purge_interval:
+                self._purge()
+
+    def _purge(self):
+        """Delete expired rows, then the soonest-expiring rows beyond max_rows (call with self._lock held)"""
+        self._writes = 0
+        self._last_purge = time.monotonic()
+        self._conn.execute('DELETE FROM responses WHERE expires_at < ?', (time.time(),))
+        if self.max_rows:
+            excess = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0] - self.max_rows
+            if excess > 0:
+                self._conn.execute(
+                    'DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY expires_at LIMIT ?)',
+                    (excess,),
+                )
+        self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+
+class ResponseCache:
+    """Looks keys up through a list of tiers and keeps hit/miss counters"""
+
+    def __init__(self, tiers):
+        self.tiers = list(tiers)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.tier_hits = {tier.name: 0 for tier in self.tiers}
+
+    def get(self, key):
+        for i, tier in enumerate(self.tiers):
+            try:
+                value = tier.get(key)
+            except Exception as e:
+                print(f"Response cache tier '{tier.name}' read failed: {e}")
+                continue
+            if value is not None:
+                for faster in self.tiers[:i]:
+                    faster.set(key, value)
+                with self._lock:
+                    self.hits += 1
+                    self.tier_hits[tier.name] += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        for tier in self.tiers:
+            try:
+                tier.set(key, value)
+            except Exception as e:
+                print(f"Response cache tier '{tier.name}' write failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'tier_hits': dict(self.tier_hits),
+                'tiers': [tier.name for tier in self.tiers],
+            }
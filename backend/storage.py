@@ -0,0 +1,416 @@
+"""Persistence for users, sessions, usage logs, stats rollups and insights.
+
+Route handlers talk to a Storage object rather than to pymongo directly.
+Two implementations share one interface:
+
+- MongoStorage: the hosted MongoDB deployment. Its client has a bounded
+  connection pool and explicit timeouts, and usage logs are written with
+  their own (cheaper) write concern.
+- SQLiteStorage: a single embedded SQLite file in WAL mode. It runs the
+  full auth and analytics paths on a laptop, in benchmarks or on a
+  single-node deployment without a remote cluster. Per-user rollups are
+  maintained with UPSERT ... count = count + excluded.count, the SQL
+  equivalent of $inc.
+
+Documents are plain dicts shaped like the Mongo documents the app has
+always written (naive-UTC datetimes, features_used as a list).
+
+BackgroundStorage opens either backend on a background thread, so a
+worker can serve (and report itself alive but not ready) while a remote
+database is still being reached.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from analytics_rollups import (
+    EMPTY_KEY, NONE_KEY, apply_session_rollups, backfill_rollups, ensure_analytics_indexes, read_user_stats,
+    user_session_count,
+)
+
+INSIGHTS_COLLECTION = 'insights'
+
+
+class DuplicateUserError(Exception):
+    """Raised by insert_user when an account with that email already exists"""
+
+
+class StorageUnavailableError(Exception):
+    """Raised when storage is used before its background connection has succeeded"""
+
+
+class BackgroundStorage:
+    """Connects a storage backend off the startup path and forwards calls to it once it is ready.
+
+    open_fn() creates the backend; it must answer ping() before it is used,
+    and its indexes are then ensured. Failed attempts are retried with
+    backoff up to `max_retry_interval` seconds. `wrap` (e.g. metrics
+    instrumentation) is applied to the backend before it is exposed.
+    """
+
+    def __init__(self, name, open_fn, wrap=None, retry_interval=1.0, max_retry_interval=30.0):
+        self.name = name
+        self._open = open_fn
+        self._wrap = wrap
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self._target = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.attempts = 0
+        self.error = None
+        self.connected_after = None
+
+    def start(self):
+        """Begin connecting on a daemon thread (once); returns self"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._connect, name=f'{self.name}-connect', daemon=True)
+                self._thread.start()
+        return self
+
+    def _connect(self):
+        start = time.monotonic()
+        delay = self.retry_interval
+        while True:
+            self.attempts += 1
+            target = None
+            try:
+                target = self._open()
+                target.ping()
+                break
+            except Exception as e:
+                self.error = str(e)
+                print(f"Storage ({self.name}) connection attempt {self.attempts} failed: {e}")
+                if target is not None:
+                    target.close()
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_retry_interval)
+        try:
+            target.ensure_indexes()
+        except Exception as e:
+            print(f"Failed to create storage indexes: {e}")
+        self._target = self._wrap(target) if self._wrap else target
+        self.error = None
+        self.connected_after = time.monotonic() - start
+        self._ready.set()
+        print(f"Storage ({self.name}) ready after {self.connected_after:.2f}s")
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        """Block until connected; returns False on timeout"""
+        return self._ready.wait(timeout)
+
+    def status(self):
+        return {
+            'backend': self.name,
+            'state': 'ready' if self.ready else 'connecting' if self._thread else 'not started',
+            'attempts': self.attempts,
+            'error': self.error,
+        }
+
+    def __getattr__(self, attr):
+        target = self.__dict__.get('_target')
+        if target is None:
+            raise StorageUnavailableError(f"Storage ({self.name}) is still connecting")
+        return getattr(target, attr)
+
+
+class MongoStorage:
+    """Storage backed by a MongoDB database"""
+
+    name = 'mongo'
+
+    def __init__(self, uri, database='chromeai_plus', max_pool_size=50, min_pool_size=0,
+                 connect_timeout_ms=5000, server_selection_timeout_ms=5000, socket_timeout_ms=10000,
+                 log_write_concern=1):
+        from pymongo import MongoClient
+        from pymongo.write_concern import WriteConcern
+
+        self.client = MongoClient(
+            uri,
+            maxPoolSize=max_pool_size,
+            minPoolSize=min_pool_size,
+            connectTimeoutMS=connect_timeout_ms,
+            serverSelectionTimeoutMS=server_selection_timeout_ms,
+            socketTimeoutMS=socket_timeout_ms,
+        )
+        self.db = self.client[database]
+        # Usage logs are high-volume and individually unimportant; MONGO_LOG_WRITE_CONCERN=0 makes them
+        # fire-and-forget (the default, 1, still waits for the primary)
+        self._usage_logs = self.db.get_collection('usage_logs', write_concern=WriteConcern(w=log_write_concern))
+
+    def ping(self):
+        self.client.admin.command('ping')
+
+    def close(self):
+        self.client.close()
+
+    def ensure_indexes(self):
+        # Lets insert_user detect existing accounts atomically instead of find-then-insert
+        self.db.users.create_index('email', unique=True, name='email_unique')
+        ensure_analytics_indexes(self.db)
+
+    # Users
+
+    def find_user(self, email):
+        return self.db.users.find_one({'email': email})
+
+    def insert_user(self, user):
+        from pymongo.errors import DuplicateKeyError
+
+        try:
+            self.db.users.insert_one(dict(user))
+        except DuplicateKeyError:
+            raise DuplicateUserError(user['email'])
+
+    # Sessions and analytics
+
+    def insert_sessions(self, sessions):
+        """Store session documents and fold them into the per-user stats rollups"""
+        sessions = [dict(session) for session in sessions]
+        if len(sessions) == 1:
+            self.db.sessions.insert_one(sessions[0])
+        else:
+            self.db.sessions.insert_many(sessions, ordered=False)
+        try:
+            apply_session_rollups(self.db, sessions)
+        except Exception as e:
+            # The sessions are stored; `flask backfill-rollups` rebuilds the counts
+            print(f"Failed to update session rollups: {e}")
+
+    def recent_sessions(self, user_id, limit):
+        return list(self.db.sessions.find({'user_id': user_id}, {'_id': 0}).sort('timestamp', -1).limit(limit))
+
+    def user_stats(self, user_id):
+        return read_user_stats(self.db, user_id)
+
+    def session_count(self, user_id):
+        return user_session_count(self.db, user_id)
+
+    def rebuild_rollups(self):
+        return backfill_rollups(self.db)
+
+    def insert_usage_logs(self, logs):
+        self._usage_logs.insert_many([dict(log) for log in logs], ordered=False)
+
+    # Insights
+
+    def get_insights(self, user_id):
+        return self.db[INSIGHTS_COLLECTION].find_one({'_id': user_id}, {'_id': 0})
+
+    def save_insights(self, user_id, doc):
+        self.db[INSIGHTS_COLLECTION].replace_one({'_id': user_id}, doc, upsert=True)
+
+
+def _count_key(value):
+    """session_counts key for a feature or document type; None and '' get the Mongo rollup sentinels"""
+    if value is None:
+        return NONE_KEY
+    if value == '':
+        return EMPTY_KEY
+    return str(value)
+
+
+def _count_value(key):
+    if key == NONE_KEY:
+        return None
+    if key == EMPTY_KEY:
+        return ''
+    return key
+
+
+# _count_key in SQL, for rebuild_rollups; the sentinels are bound as parameters
+_COUNT_KEY_SQL = "CASE WHEN {0} IS NULL THEN ? WHEN {0} = '' THEN ? ELSE {0} END"
+
+
+class SQLiteStorage:
+    """Storage in an embedded SQLite database (WAL mode, shared by all worker processes on the host)"""
+
+    name = 'sqlite'
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS users ('
+        'email TEXT PRIMARY KEY, password TEXT NOT NULL, created_at TEXT)',
+        'CREATE TABLE IF NOT EXISTS sessions ('
+        'id INTEGER PRIMARY KEY, user_id TEXT, document_type TEXT, features_used TEXT, '
+        'duration REAL, timestamp TEXT)',
+        'CREATE INDEX IF NOT EXISTS sessions_user_id_timestamp ON sessions (user_id, timestamp DESC)',
+        'CREATE TABLE IF NOT EXISTS usage_logs ('
+        'id INTEGER PRIMARY KEY, user_id TEXT, feature TEXT, metadata TEXT, timestamp TEXT)',
+        'CREATE TABLE IF NOT EXISTS session_totals ('
+        'user_id TEXT PRIMARY KEY, total_sessions INTEGER NOT NULL, total_duration REAL NOT NULL)',
+        # kind is 'feature' or 'document_type'; NULL and '' keys are stored as '~none' and '~empty' (as in Mongo)
+        'CREATE TABLE IF NOT EXISTS session_counts ('
+        'user_id TEXT, kind TEXT, key TEXT, count INTEGER NOT NULL, PRIMARY KEY (user_id, kind, key))',
+        'CREATE TABLE IF NOT EXISTS insights (user_id TEXT PRIMARY KEY, doc TEXT NOT NULL)',
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self.ensure_indexes()
+
+    def ping(self):
+        with self._lock:
+            self._conn.execute('SELECT 1')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def ensure_indexes(self):
+        with self._lock, self._conn:
+            for statement in self.SCHEMA:
+                self._conn.execute(statement)
+
+    @staticmethod
+    def _time(value):
+        return value.isoformat() if isinstance(value, datetime) else value
+
+    # Users
+
+    def find_user(self, email):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT email, password, created_at FROM users WHERE email = ?', (email,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'email': row[0], 'password': row[1], 'created_at': datetime.fromisoformat(row[2])}
+
+    def insert_user(self, user):
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    'INSERT INTO users (email, password, created_at) VALUES (?, ?, ?)',
+                    (user['email'], user['password'], self._time(user.get('created_at'))),
+                )
+        except sqlite3.IntegrityError:
+            raise DuplicateUserError(user['email'])
+
+    # Sessions and analytics
+
+    def insert_sessions(self, sessions):
+        """Store session documents and update the rollups in the same transaction"""
+        totals = {}
+        counts = Counter()
+        rows = []
+        for session in sessions:
+            user_id = session['user_id']
+            features = session.get('features_used') or []
+            duration = session.get('duration') or 0
+            rows.append((user_id, session.get('document_type'), json.dumps(features), duration,
+                         self._time(session['timestamp'])))
+            sessions_seen, duration_seen = totals.get(user_id, (0, 0))
+            totals[user_id] = (sessions_seen + 1, duration_seen + duration)
+            for feature in features:
+                counts[(user_id, 'feature', _count_key(feature))] += 1
+            counts[(user_id, 'document_type', _count_key(session.get('document_type')))] += 1
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT INTO sessions (user_id, document_type, features_used, duration, timestamp) '
+                'VALUES (?, ?, ?, ?, ?)', rows,
+            )
+            self._conn.executemany(
+                'INSERT INTO session_totals (user_id, total_sessions, total_duration) VALUES (?, ?, ?) '
+                'ON CONFLICT (user_id) DO UPDATE SET '
+                'total_sessions = total_sessions + excluded.total_sessions, '
+                'total_duration = total_duration + excluded.total_duration',
+                [(user_id, n, duration) for user_id, (n, duration) in totals.items()],
+            )
+            self._conn.executemany(
+                'INSERT INTO session_counts (user_id, kind, key, count) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (user_id, kind, key) DO UPDATE SET count = count + excluded.count',
+                [(*key, n) for key, n in counts.items()],
+            )
+
+    def recent_sessions(self, user_id, limit):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT user_id, document_type, features_used, duration, timestamp FROM sessions '
+                'WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?', (user_id, limit),
+            ).fetchall()
+        return [{
+            'user_id': row[0],
+            'document_type': row[1],
+            'features_used': json.loads(row[2]),
+            'duration': row[3],
+            'timestamp': datetime.fromisoformat(row[4]),
+        } for row in rows]
+
+    def user_stats(self, user_id):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT kind, key, count FROM session_counts WHERE user_id = ? AND count > 0 '
+                'ORDER BY count DESC', (user_id,),
+            ).fetchall()
+        stats = {'total_sessions': self.session_count(user_id), 'feature_usage': [], 'document_types': []}
+        for kind, key, count in rows:
+            item = {'_id': _count_value(key), 'count': count}
+            stats['feature_usage' if kind == 'feature' else 'document_types'].append(item)
+        return stats
+
+    def session_count(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT total_sessions FROM session_totals WHERE user_id = ?', (user_id,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def rebuild_rollups(self):
+        """Recompute all rollups from the sessions table; returns the number of users"""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM session_totals')
+            self._conn.execute('DELETE FROM session_counts')
+            self._conn.execute(
+                'INSERT INTO session_totals (user_id, total_sessions, total_duration) '
+                'SELECT user_id, COUNT(*), COALESCE(SUM(duration), 0) FROM sessions GROUP BY user_id'
+            )
+            self._conn.execute(
+                f"INSERT INTO session_counts (user_id, kind, key, count) "
+                f"SELECT user_id, 'document_type', {_COUNT_KEY_SQL.format('document_type')}, COUNT(*) "
+                f"FROM sessions GROUP BY 1, 3",
+                (NONE_KEY, EMPTY_KEY),
+            )
+            self._conn.execute(
+                f"INSERT INTO session_counts (user_id, kind, key, count) "
+                f"SELECT s.user_id, 'feature', {_COUNT_KEY_SQL.format('f.value')}, COUNT(*) "
+                f"FROM sessions s, json_each(s.features_used) f GROUP BY 1, 3",
+                (NONE_KEY, EMPTY_KEY),
+            )
+            return self._conn.execute('SELECT COUNT(*) FROM session_totals').fetchone()[0]
+
+    def insert_usage_logs(self, logs):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT INTO usage_logs (user_id, feature, metadata, timestamp) VALUES (?, ?, ?, ?)',
+                [(log['user_id'], log['feature'], json.dumps(log.get('metadata') or {}),
+                  self._time(log['timestamp'])) for log in logs],
+            )
+
+    # Insights
+
+    def get_insights(self, user_id):
+        with self._lock:
+            row = self._conn.execute('SELECT doc FROM insights WHERE user_id = ?', (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_insights(self, user_id, doc):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT INTO insights (user_id, doc) VALUES (?, ?) '
+                'ON CONFLICT (user_id) DO UPDATE SET doc = excluded.doc',
+                (user_id, json.dumps(doc)),
+            )
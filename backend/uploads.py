@@ -0,0 +1,157 @@
+"""Streaming, content-addressed document uploads.
+
+HashingFileStream is handed to werkzeug's multipart parser as the
+destination for an uploaded file part. The parser writes each chunk to it
+as it arrives. The stream checks the file's magic bytes as soon as the
+head is available, enforces the size limit while the upload is still in
+flight, hashes the bytes, and spools them to a temporary file next to the
+final location. store() then moves the file to "<sha256><ext>", so
+identical uploads share one file and different files with the same name
+no longer overwrite each other. UploadJanitor deletes files whose last
+upload is older than a TTL.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+HEAD_BYTES = 1024
+PARTIAL_SUFFIX = '.part'
+
+
+class UploadRejected(Exception):
+    """Raised while streaming an upload that is too large or not the type it claims to be.
+
+    Deliberately not a ValueError: werkzeug's form parser silently swallows those.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _looks_like(extension, head):
+    if extension == '.pdf':
+        # The PDF header may be preceded by a little junk; readers accept it within the first 1KB
+        return b'%PDF-' in head[:HEAD_BYTES]
+    if extension == '.docx':
+        return head.startswith(b'PK\x03\x04')
+    return False
+
+
+class HashingFileStream:
+    """Writable sink that validates, size-limits and hashes an upload while spooling it to disk"""
+
+    def __init__(self, directory, extension, max_bytes):
+        self.extension = extension
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.stored = False
+        self._head = b''
+        self._checked = False
+        self._hash = hashlib.sha256()
+        fd, self.temp_path = tempfile.mkstemp(dir=directory, suffix=PARTIAL_SUFFIX)
+        self._fh = os.fdopen(fd, 'w+b')
+
+    def _reject(self, message, status=400):
+        self.discard()
+        raise UploadRejected(message, status)
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self._reject(f"File larger than {self.max_bytes // (1024 * 1024)} MB", 413)
+        if not self._checked:
+            self._head += data[:HEAD_BYTES - len(self._head)]
+            if len(self._head) >= HEAD_BYTES or self._head.startswith(b'PK\x03\x04'):
+                self._check_type()
+        self._hash.update(data)
+        return self._fh.write(data)
+
+    def _check_type(self):
+        self._checked = True
+        if not _looks_like(self.extension, self._head):
+            self._reject(f"File content is not a valid {self.extension[1:].upper()} document")
+
+    # werkzeug rewinds the container and FileStorage may read from it
+    def seek(self, *args):
+        return self._fh.seek(*args)
+
+    def tell(self):
+        return self._fh.tell()
+
+    def read(self, *args):
+        return self._fh.read(*args)
+
+    def readline(self, *args):
+        return self._fh.readline(*args)
+
+    def close(self):
+        self._fh.close()
+
+    def discard(self):
+        """Close and delete the temporary file"""
+        try:
+            self._fh.close()
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+    def store(self, directory):
+        """Finish the upload: move it to its content-addressed name and return (filename, digest)"""
+        if not self._checked:
+            # Files shorter than the sniffing window
+            self._check_type()
+        self._fh.close()
+        self.stored = True
+        digest = self._hash.hexdigest()
+        filename = f"{digest}{self.extension}"
+        final_path = os.path.join(directory, filename)
+        if os.path.exists(final_path):
+            # Duplicate content: keep the existing copy and refresh its TTL
+            os.remove(self.temp_path)
+            os.utime(final_path, None)
+        else:
+            os.replace(self.temp_path, final_path)
+        return filename, digest
+
+
+class UploadJanitor:
+    """Background sweeper that deletes uploads older than `ttl` seconds"""
+
+    def __init__(self, directory, ttl, interval):
+        self.directory = directory
+        self.ttl = ttl
+        self.interval = interval
+        self._thread = threading.Thread(target=self._run, name='upload-janitor', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def sweep(self):
+        """Delete expired uploads and abandoned partial files; returns bytes reclaimed"""
+        cutoff = time.time() - self.ttl
+        reclaimed = 0
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            try:
+                st = entry.stat()
+                if st.st_mtime < cutoff:
+                    os.remove(entry.path)
+                    reclaimed += st.st_size
+            except OSError:
+                continue
+        return reclaimed
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                reclaimed = self.sweep()
+                if reclaimed:
+                    print(f"Upload janitor reclaimed {reclaimed // 1024} KB")
+            except Exception as e:
+                print(f"Upload janitor failed: {e}")
@@ -0,0 +1,114 @@
+"""Batched, asynchronous writer for usage log documents.
+
+Request handlers enqueue log documents onto a bounded in-process queue and
+return immediately; a background thread writes them in batches with
+insert_many once `batch_size` documents are waiting or `flush_interval`
+seconds have passed. When the queue is full, enqueue waits up to
+`block_timeout` seconds (0 = never) and then drops the document, counting it.
+Pending documents are flushed at interpreter shutdown.
+"""
+import atexit
+import queue
+import threading
+import time
+
+
+class UsageLogger:
+    """Bounded queue plus background flusher that writes batches through `sink(docs)`"""
+
+    def __init__(self, sink, batch_size=100, flush_interval=2.0, max_queue=10000, block_timeout=0.0, label='usage log'):
+        self.sink = sink
+        self.label = label
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name=label.replace(' ', '-') + 'ger', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, doc):
+        """Queue a document for writing; returns False if it had to be dropped"""
+        try:
+            if self.block_timeout > 0:
+                self._queue.put(doc, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(doc)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                dropped = self.dropped
+            if dropped == 1 or dropped % 1000 == 0:
+                print(f"{self.label.capitalize()} queue full, {dropped} entries dropped so far")
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def _take_batch(self, timeout):
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=timeout))
+        except queue.Empty:
+            return batch
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        try:
+            self.sink(batch)
+            with self._lock:
+                self.written += len(batch)
+        except Exception as e:
+            with self._lock:
+                self.failed += len(batch)
+            print(f"Failed to write {len(batch)} {self.label}s: {e}")
+
+    def _run(self):
+        pending = []
+        deadline = time.monotonic() + self.flush_interval
+        while not self._stop.is_set():
+            pending.extend(self._take_batch(max(0.0, deadline - time.monotonic())))
+            if len(pending) >= self.batch_size or time.monotonic() >= deadline:
+                if pending:
+                    self._write(pending)
+                    pending = []
+                deadline = time.monotonic() + self.flush_interval
+        if pending:
+            self._write(pending)
+
+    def flush(self):
+        """Synchronously write everything currently queued"""
+        while True:
+            batch = self._take_batch(0)
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self):
+        """Stop the background thread and write whatever is still queued"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+            }